@@ -0,0 +1,149 @@
+import os
+import sys
+import uuid
+import argparse
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from machinelog.blobstore import LocalBlobStore
+from machinelog.datastore import CUSTOMERS_COLUMNS, MACHINES_COLUMNS, JOBS_COLUMNS
+from machinelog.sqlstore import COORD_COLUMNS
+
+# -----------------------------------------------------------------------------
+# Synthetic customers.csv / machines.csv / jobs.csv plus a media store, laid
+# out like a live deployment so bench/run_benchmarks.py can be pointed at it.
+#   python bench/generate_data.py /tmp/ml-large --scale large
+# -----------------------------------------------------------------------------
+SCALES = {                 # customers, machines per customer, jobs
+    "tiny":   (20,      2,   200),
+    "small":  (200,     2,   5_000),
+    "medium": (2_000,   2,   50_000),
+    "large":  (10_000,  2,   500_000),
+}
+
+BUSINESS  = ["Cafe","Bakery","Espresso Bar","Bistro","Roasters","Diner","Hotel","University"]
+NAMES     = ["Calvin","Adonai","Miki","Priya","Jordan","Sam","Alex","Morgan","Taylor","Chris"]
+SURNAMES  = ["Su","Garcia","Horvath","Patel","Lee","Smith","Nguyen","Brown","Martin","Wong"]
+STREETS   = ["Dundas St W","Queen St E","King St W","Yonge St","Bloor St W","Spadina Ave",
+             "College St","Bathurst St","Eglinton Ave E","Assiniboine Rd"]
+CITIES    = ["Toronto, ON","North York, ON","Etobicoke, ON","Scarborough, ON","Mississauga, ON"]
+BRANDS    = {"La Marzocco": ["GB5","Linea PB","Strada"], "Schaerer": ["Coffee Art Plus","Prime"],
+             "Cimbali": ["M39","M100"], "Jura": ["Giga X8","WE8"], "Rancilio": ["Classe 9","Silvia"]}
+TECHS     = ["Adonai Garcia","Miki Horvath"]
+TASKS     = ["Changed both gaskets and the water pump", "Descaled boiler and replaced group seals",
+             "Replaced pressure switch", "Annual preventive maintenance",
+             "Fixed steam wand leak", "Calibrated grinder and flowmeter"]
+PARTS     = ["2 gaskets\n1 water pump", "1 pressure switch", "4 group seals\n2 shower screens",
+             "", "1 steam valve", "1 flowmeter\n2 o-rings"]
+COMMENTS  = ["", "", "Customer asked for a follow-up next month", "Machine in good condition"]
+
+def make_media(store, n, rng, size):
+    # n distinct photos + a few short "videos" and signatures; jobs reuse them
+    photos, videos, sigs = [], [], []
+    for i in range(n):
+        im = Image.effect_noise(size, 40 + i % 60).convert("RGB")
+        p = store.staging_path() + ".jpg"
+        im.save(p, "JPEG", quality=85)
+        photos.append(store.put(p, f"IMG_{1000 + i}.jpeg", move=True))
+    for i in range(max(1, n // 10)):
+        p = store.staging_path()
+        with open(p, "wb") as f:
+            f.write(rng.bytes(512 * 1024))
+        videos.append(store.put(p, f"VID_{1000 + i}.mp4", move=True))
+    for i in range(max(1, n // 5)):
+        im = Image.new("RGB", (300, 100), "white")
+        p = store.staging_path() + ".png"
+        im.save(p, "PNG")
+        sigs.append(store.put(p, f"sig_{i}.png", move=True))
+    return photos, videos, sigs
+
+def generate(out, n_customers, per_customer, n_jobs, n_media=20, image_size=(1600, 1200), seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(out, exist_ok=True)
+    store = LocalBlobStore(os.path.join(out, "media_store"))
+    photos, videos, sigs = make_media(store, n_media, rng, image_size)
+    pick = lambda items, n: np.asarray(items, dtype=object)[rng.integers(0, len(items), n)]
+
+    # customers: unique company names, coordinates around Toronto
+    cids = [str(uuid.uuid4()) for _ in range(n_customers)]
+    first, last = pick(NAMES, n_customers), pick(SURNAMES, n_customers)
+    customers = pd.DataFrame({
+        "ID":           cids,
+        "Company Name": [f"{b} {s} #{i}" for i, (b, s) in
+                         enumerate(zip(pick(BUSINESS, n_customers), last))],
+        "Contact Name": [f"{a} {b}" for a, b in zip(first, last)],
+        "Address":      [f"{n} {s}, {c}" for n, s, c in zip(rng.integers(1, 999, n_customers),
+                         pick(STREETS, n_customers), pick(CITIES, n_customers))],
+        "Phone":        [f"647-{a:03d}-{b:04d}" for a, b in zip(rng.integers(0, 999, n_customers),
+                                                                 rng.integers(0, 9999, n_customers))],
+        "Email":        [f"{a.lower()}{i}@example.com" for i, a in enumerate(first)],
+        "Latitude":     43.70 + rng.normal(0, 0.08, n_customers),
+        "Longitude":   -79.40 + rng.normal(0, 0.12, n_customers),
+    })[CUSTOMERS_COLUMNS + COORD_COLUMNS]   # coordinates included: no geocoding needed
+
+    # machines: per_customer on average
+    n_machines = n_customers * per_customer
+    brand = pick(list(BRANDS), n_machines)
+    machines = pd.DataFrame({
+        "ID":            [str(uuid.uuid4()) for _ in range(n_machines)],
+        "Customer ID":   np.asarray(cids, dtype=object)[rng.integers(0, n_customers, n_machines)],
+        "Brand":         brand,
+        "Model":         [BRANDS[b][k % len(BRANDS[b])] for b, k in
+                          zip(brand, rng.integers(0, 3, n_machines))],
+        "Year":          rng.integers(1995, 2025, n_machines),
+        "Serial Number": [f"L{n:06d}" for n in rng.integers(0, 999999, n_machines)],
+        "Photo Path":    pick(photos, n_machines),
+        "Observations":  "",
+    })[MACHINES_COLUMNS]
+
+    # jobs: random machine, dates over the last 5 years
+    m = rng.integers(0, n_machines, n_jobs)
+    tin  = rng.integers(7 * 60, 16 * 60, n_jobs)
+    tout = tin + rng.integers(15, 240, n_jobs)
+    fmt  = lambda mins: [f"{x // 60:02d}:{x % 60:02d}:00" for x in mins]
+    media = lambda n: [";".join(x) for x in zip(pick(photos, n), pick(photos + videos, n))]
+    jobs = pd.DataFrame({
+        "Job ID":              [str(uuid.uuid4()) for _ in range(n_jobs)],
+        "Customer ID":         machines["Customer ID"].to_numpy()[m],
+        "Machine ID":          machines["ID"].to_numpy()[m],
+        "Employee Name":       [f"{a} {b}" for a, b in zip(pick(NAMES, n_jobs), pick(SURNAMES, n_jobs))],
+        "Technician":          pick(TECHS, n_jobs),
+        "Date":                (pd.Timestamp("2021-01-01")
+                                + pd.to_timedelta(rng.integers(0, 5 * 365, n_jobs), unit="D")).strftime("%Y-%m-%d"),
+        "Travel Time (min)":   rng.integers(5, 90, n_jobs),
+        "Time In":             fmt(tin),
+        "Time Out":            fmt(np.minimum(tout, 23 * 60 + 59)),
+        "Job Description":     pick(TASKS, n_jobs),
+        "Parts Used":          pick(PARTS, n_jobs),
+        "Additional Comments": pick(COMMENTS, n_jobs),
+        "Machine as Found Paths": media(n_jobs),
+        "Machine as Left Paths":  media(n_jobs),
+        "Signature Path":      pick(sigs, n_jobs),
+    })[JOBS_COLUMNS]
+
+    customers.to_csv(os.path.join(out, "customers.csv"), index=False)
+    machines.to_csv(os.path.join(out, "machines.csv"), index=False)
+    jobs.to_csv(os.path.join(out, "jobs.csv"), index=False)
+    return {"customers": n_customers, "machines": n_machines, "jobs": n_jobs,
+            "media_files": len(photos) + len(videos) + len(sigs)}
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate synthetic Machine Logger data.")
+    ap.add_argument("out")
+    ap.add_argument("--scale", choices=SCALES, default="small")
+    ap.add_argument("--customers", type=int)
+    ap.add_argument("--machines-per-customer", type=int)
+    ap.add_argument("--jobs", type=int)
+    ap.add_argument("--media-files", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=0)
+    a = ap.parse_args()
+    c, mpc, j = SCALES[a.scale]
+    print(generate(a.out, a.customers or c, a.machines_per_customer or mpc, a.jobs or j,
+                   a.media_files, seed=a.seed))
+
+if __name__ == "__main__":
+    main()
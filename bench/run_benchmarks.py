@@ -0,0 +1,221 @@
+import io
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import platform
+import subprocess
+import statistics
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP  = os.path.join(ROOT, "machine_logger.py")
+sys.path.insert(0, ROOT)
+
+# -----------------------------------------------------------------------------
+# Times the app's hot paths with Streamlit's AppTest against a data directory
+# (see generate_data.py). Git pushes go to a local bare repo, mail to a local
+# aiosmtpd server when installed. Results are written as JSON so runs from
+# different versions can be diffed.
+#   python bench/run_benchmarks.py /tmp/ml-large --generate large --out large.json
+# -----------------------------------------------------------------------------
+APP_TIMEOUT = 600
+SMTP_PORT   = 8025
+GITIGNORE   = "media_store/\nmedia_bucket/\noutbox/\n.push_queue.json\n*.tmp\ngeocode_cache.json\n"
+
+def git(*args, cwd=None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+def setup_git(data):
+    # data dir becomes a repo whose origin is a bare repo next to it
+    remote = os.path.abspath(data) + ".remote.git"
+    if not os.path.exists(os.path.join(data, ".git")):
+        with open(os.path.join(data, ".gitignore"), "w") as f:
+            f.write(GITIGNORE)
+        git("init", "-q", "-b", "main", cwd=data)
+        git("config", "user.name", "bench", cwd=data)
+        git("config", "user.email", "bench@example.com", cwd=data)
+        git("add", ".gitignore", "customers.csv", "machines.csv", "jobs.csv", cwd=data)
+        git("commit", "-q", "-m", "bench data", cwd=data)
+        git("init", "-q", "--bare", "-b", "main", remote)
+        git("config", "uploadpack.allowFilter", "true", cwd=remote)
+        git("remote", "add", "origin", remote, cwd=data)
+        git("push", "-q", "origin", "main", cwd=data)
+    return remote
+
+def start_smtp():
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        return None
+    class Sink:
+        async def handle_DATA(self, server, session, envelope):
+            return "250 OK"
+    c = Controller(Sink(), hostname="127.0.0.1", port=SMTP_PORT)
+    c.start()
+    return c
+
+class FakeUpload(io.BytesIO):
+    def __init__(self, name, data, type="image/jpeg"):
+        super().__init__(data)
+        self.name, self.size, self.type = name, len(data), type
+
+def bench_photo():
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.effect_noise((1600, 1200), 50).convert("RGB").save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+def install_stubs(stats):
+    # widgets AppTest cannot drive: uploads and the signature canvas
+    import numpy as np
+    import streamlit as st
+    import streamlit_folium
+    photo = bench_photo()
+    def file_uploader(label, *a, accept_multiple_files=False, **k):
+        files = [FakeUpload(f"bench_{int(time.time_ns())}.jpg", photo)]
+        return files if accept_multiple_files else files[0]
+    st.file_uploader = file_uploader
+    canvas = types.ModuleType("streamlit_drawable_canvas")
+    canvas.st_canvas = lambda **k: SimpleNamespace(image_data=np.full((100, 300, 4), 255, np.uint8))
+    sys.modules["streamlit_drawable_canvas"] = canvas
+    real_folium = streamlit_folium.st_folium
+    def st_folium(*a, **k):
+        t = time.perf_counter()
+        try:
+            return real_folium(*a, **k)
+        finally:
+            stats.setdefault("map_st_folium", []).append(time.perf_counter() - t)
+    streamlit_folium.st_folium = st_folium
+
+def new_app(remote):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP, default_timeout=APP_TIMEOUT)
+    at.secrets["github"] = {"token": "bench", "repo": "bench/bench", "branch": "main",
+                            "user_name": "bench", "user_email": "bench@example.com",
+                            "remote_url": remote}
+    at.secrets["email"] = {"user": "bench@example.com", "password": "", "ssl": False,
+                           "smtp_server": "127.0.0.1", "smtp_port": SMTP_PORT}
+    return at
+
+def timed(stats, name, fn):
+    t = time.perf_counter()
+    out = fn()
+    stats.setdefault(name, []).append(time.perf_counter() - t)
+    return out
+
+def check(at, name):
+    if at.exception:
+        raise RuntimeError(f"{name}: {at.exception[0].value}")
+
+def summary(samples):
+    ms = sorted(s * 1000 for s in samples)
+    return {"n": len(ms), "median_ms": round(statistics.median(ms), 2),
+            "p90_ms": round(ms[int(0.9 * (len(ms) - 1))], 2),
+            "min_ms": round(ms[0], 2), "max_ms": round(ms[-1], 2)}
+
+def cold_start(data, remote):
+    # child process: first run with empty caches and nothing imported yet
+    os.chdir(data)
+    stats = {}
+    install_stubs(stats)
+    at = new_app(remote)
+    timed(stats, "cold_start", at.run)
+    check(at, "cold_start")
+    print(json.dumps({"cold_start": stats["cold_start"][0]}))
+
+def warm_paths(data, remote, repeat, stats):
+    import pandas as pd
+    os.chdir(data)
+    install_stubs(stats)
+    customers = pd.read_csv("customers.csv", usecols=["ID", "Company Name"])
+    machines  = pd.read_csv("machines.csv", usecols=["Customer ID"])
+    names     = customers.set_index("ID")["Company Name"]
+    with_machines = names.loc[machines["Customer ID"].drop_duplicates().head(repeat)].tolist()
+
+    at = new_app(remote)
+    at.run()
+    check(at, "warm-up")
+    stats.pop("map_st_folium", None)
+    for _ in range(repeat):
+        timed(stats, "select_rerun", at.run)
+        check(at, "select_rerun")
+
+    for i in range(repeat):
+        at.session_state["mode"] = "existing"
+        at.session_state["selected_customer"] = with_machines[i % len(with_machines)]
+        timed(stats, "customer_machine_lookup", at.run)
+        check(at, "customer_machine_lookup")
+        sb = at.selectbox(key="machine")
+        timed(stats, "machine_page", sb.set_value(sb.options[1]).run)
+        check(at, "machine_page")
+
+        next(w for w in at.text_area if w.label == "Job Description*").input(f"bench job {i}")
+        next(w for w in at.text_input if w.label == "Employee Full Name*").input("Bench Runner")
+        submit = next(b for b in at.button if b.label == "Submit Job")
+        timed(stats, "job_submit", submit.click().run)
+        check(at, "job_submit")
+        if not any("Job logged" in s.value for s in at.success):
+            raise RuntimeError(f"job_submit: {[e.value for e in at.error]}")
+
+        for view, key in (("All Jobs", "admin_jobs"), ("All Customers", "admin_customers"),
+                          ("All Machines", "admin_machines")):
+            at.session_state["admin_view"] = view
+            timed(stats, key, at.run)
+            check(at, key)
+        at.session_state["admin_view"] = None
+
+def count_rows(data):
+    import pandas as pd
+    return {name: len(pd.read_csv(os.path.join(data, f"{name}.csv"), usecols=[0]))
+            for name in ("customers", "machines", "jobs")}
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark Machine Logger hot paths.")
+    ap.add_argument("data")
+    ap.add_argument("--generate", metavar="SCALE", help="create the data dir first")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--cold-runs", type=int, default=3)
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--cold", action="store_true", help=argparse.SUPPRESS)
+    a = ap.parse_args()
+    data = os.path.abspath(a.data)
+
+    if a.cold:
+        return cold_start(data, setup_git(data))
+
+    if a.generate:
+        from generate_data import SCALES, generate
+        c, mpc, j = SCALES[a.generate]
+        generate(data, c, mpc, j)
+    remote = setup_git(data)
+    smtp   = start_smtp()
+
+    stats = {"cold_start": []}
+    for _ in range(a.cold_runs):
+        p = subprocess.run([sys.executable, os.path.abspath(__file__), data, "--cold"],
+                           check=True, capture_output=True, text=True)
+        stats["cold_start"].append(json.loads(p.stdout.strip().splitlines()[-1])["cold_start"])
+    try:
+        warm_paths(data, remote, a.repeat, stats)
+    finally:
+        if smtp:
+            smtp.stop()
+
+    import streamlit
+    rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                         capture_output=True, text=True).stdout.strip()
+    result = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "app_rev": rev,
+                 "python": platform.python_version(), "streamlit": streamlit.__version__,
+                 "rows": count_rows(data), "repeat": a.repeat, "smtp_stub": smtp is not None},
+        "results": {k: summary(v) for k, v in stats.items() if v},
+    }
+    with open(a.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result["results"], indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,123 +1,128 @@
 import re
 import os
+import time
 import uuid
-import smtplib
-import mimetypes
+import threading
 from datetime import datetime
 
 import streamlit as st
 import pandas as pd
-import folium
-from PIL import Image
-from geopy.geocoders import Nominatim
-from streamlit_folium import st_folium
-from folium.plugins import Search, LocateControl
-from email import encoders
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from streamlit_drawable_canvas import st_canvas
-from git import Repo  # GitPython
+from machinelog import perf
+from machinelog.config import Settings
+from machinelog.services import Services, SEARCH_SPEC
+from machinelog.datastore import CUSTOMERS_FILE, Conflict
+from machinelog.blobstore import BlobTooLarge, parse_ref
+from machinelog.derivatives import derivative_path
+from machinelog.media import MB, VIDEO_INLINE_MB, media_name, is_video
+from machinelog.bulk import (PHONE_RE, EMAIL_RE, YEAR_MIN, KINDS, valid_address, read_batch,
+                             validate, import_rows, csv_bytes)
 
 # -----------------------------------------------------------------------------
-# 0) CONFIGURE: where to dump all media
+# 0) CONFIGURE: knobs from .streamlit/secrets.toml. Tables, git, outbox, media
+#    and caches live in one Services object per process (see machinelog/),
+#    each part built on first use; this file is only the page on top.
+#    folium, streamlit_folium, the signature canvas and PIL are imported by
+#    the sections that draw them.
 # -----------------------------------------------------------------------------
-MEDIA_ROOT = "media/customers"
+settings = Settings(st.secrets)
+
+def setting(section, key, default=None):
+    return settings.get(section, key, default)
+
+@st.cache_resource
+def get_services():
+    return Services(settings)
+
+svc = get_services()
 
 # -----------------------------------------------------------------------------
-# 1) STARTUP: git pull latest CSVs & media from GitHub
+# 0b) TIMING: span("phase") around hot paths (see machinelog/perf.py). ?debug=1 or
+#     [debug] panel = true shows this rerun's breakdown in the sidebar;
+#     [debug] timing_log = "perf.jsonl" writes rotating latency histograms.
+#     With both off a span is a shared no-op.
 # -----------------------------------------------------------------------------
-try:
-    token     = st.secrets["github"]["token"]
-    repo_name = st.secrets["github"]["repo"]
-    branch    = st.secrets["github"]["branch"]
-    repo      = Repo(os.getcwd())
-    origin    = repo.remote(name="origin")
-    origin.set_url(f"https://{token}@github.com/{repo_name}.git")
-    origin.pull(refspec=f"{branch}:{branch}")
-except Exception as e:
-    st.warning(f"Could not git pull media & CSVs: {e}")
+perf.configure(setting("debug", "timing_log"))
+DEBUG_PANEL = st.query_params.get("debug") == "1" or setting("debug", "panel", False)
+RUN_SPANS   = [] if DEBUG_PANEL else None
+RUN_START   = time.perf_counter()
+
+def span(name):
+    return perf.span(name, RUN_SPANS)
+
+def show_timings():
+    if RUN_SPANS is None:
+        return
+    total = (time.perf_counter() - RUN_START) * 1000
+    with st.sidebar.expander(f"⏱️ Rerun timings ({total:.0f} ms)", expanded=True):
+        if RUN_SPANS:
+            t = pd.DataFrame(RUN_SPANS, columns=["Phase", "ms"])
+            t = t.groupby("Phase", sort=False)["ms"].agg(["count", "sum"]).round(1)
+            st.dataframe(t.rename(columns={"count": "Calls", "sum": "ms"}))
+        st.caption(f"Unaccounted: {total - sum(ms for _, ms in RUN_SPANS):.0f} ms")
+
+def stop():
+    show_timings()
+    st.stop()
 
 # -----------------------------------------------------------------------------
-# 2) FILES & SCHEMA
+# 1) SYNC: pull once per process here, then every sync_ttl seconds (default
+#    60) on a background thread, so rows from other replicas show up when the
+#    tables refresh; sparse checkouts fetch media on demand
+#    (see machinelog/gitsync.py)
 # -----------------------------------------------------------------------------
-CUSTOMERS_FILE = "customers.csv"
-MACHINES_FILE  = "machines.csv"
-JOBS_FILE      = "jobs.csv"
+repo_sync = svc.repo_sync
+with span("git_sync"):
+    repo_sync.sync()
+if repo_sync.error:
+    st.warning(f"Could not git pull media & CSVs: {repo_sync.error}")
 
-CUSTOMERS_COLUMNS = ["ID","Company Name","Contact Name","Address","Phone","Email"]
-MACHINES_COLUMNS  = ["ID","Customer ID","Brand","Model","Year",
-                     "Serial Number","Photo Path","Observations"]
-JOBS_COLUMNS      = [
-    "Job ID","Customer ID","Machine ID","Employee Name","Technician",
-    "Date","Travel Time (min)","Time In","Time Out","Job Description",
-    "Parts Used","Additional Comments",
-    "Machine as Found Paths","Machine as Left Paths","Signature Path"
-]
+# -----------------------------------------------------------------------------
+# 2) FILES & SCHEMA: CSV tables + journals (see machinelog/datastore.py)
+# -----------------------------------------------------------------------------
+db = svc.db
+with span("csv_load"):
+    customers = db.customers.refresh()
+    machines  = db.machines.refresh()
+    jobs      = db.jobs.refresh()
 
-def load_df(path, cols):
-    return pd.read_csv(path) if os.path.exists(path) else pd.DataFrame(columns=cols)
+# -----------------------------------------------------------------------------
+# 3) GIT PUSH QUEUE (CSV + media): saves from every session and replica enqueue;
+#    the process holding the writer lease commits coalesced batches, pushes
+#    with retry/backoff and merges when origin moved on. Survives restarts.
+# -----------------------------------------------------------------------------
+def push_to_github(files, message):
+    svc.push_to_github(files, message, RUN_SPANS)
 
-customers = load_df(CUSTOMERS_FILE, CUSTOMERS_COLUMNS)
-machines  = load_df(MACHINES_FILE,  MACHINES_COLUMNS)
-jobs      = load_df(JOBS_FILE,      JOBS_COLUMNS)
+# -----------------------------------------------------------------------------
+# 4) EMAIL OUTBOX: svc.notify_job() persists the job emails under
+#    outbox/pending when the job is saved; a background worker sends them
+#    (signature and PDF report attached) once the report is rendered, with
+#    retry/backoff
+#    (see machinelog/services.py and machinelog/mail.py)
+# -----------------------------------------------------------------------------
 
 # -----------------------------------------------------------------------------
-# 3) GIT PUSH HELPER (CSV + media)
+# 4b) MEDIA STORE: content-addressed blobs outside git, with web + thumbnail
+#     copies and job reports built in a process pool (see machinelog/media.py)
 # -----------------------------------------------------------------------------
-def push_to_github(files, message):
-    token      = st.secrets["github"]["token"]
-    repo_name  = st.secrets["github"]["repo"]
-    branch     = st.secrets["github"]["branch"]
-    user_name  = st.secrets["github"]["user_name"]
-    user_email = st.secrets["github"]["user_email"]
-
-    repo   = Repo(os.getcwd())
-    origin = repo.remote(name="origin")
-    origin.set_url(f"https://{token}@github.com/{repo_name}.git")
-
-    repo.config_writer().set_value("user", "name",  user_name).release()
-    repo.config_writer().set_value("user", "email", user_email).release()
-
-    repo.index.add(files)
-    repo.index.commit(message)
-    origin.push(refspec=f"{branch}:{branch}")
-
-# -----------------------------------------------------------------------------
-# 4) EMAIL SENDER (attaches signature only)
-# -----------------------------------------------------------------------------
-def send_email(recipients, subject, html_body, sig_path):
-    sender      = st.secrets["email"]["user"]
-    password    = st.secrets["email"]["password"]
-    smtp_server = st.secrets["email"]["smtp_server"]
-    smtp_port   = st.secrets["email"]["smtp_port"]
-
-    msg = MIMEMultipart("mixed")
-    msg["Subject"] = subject
-    msg["From"]    = sender
-    msg["To"]      = ", ".join(recipients)
-
-    alt = MIMEMultipart("alternative")
-    # Plain‑text fallback
-    text = re.sub(r"<.*?>","", html_body).replace("<br>","\n")
-    alt.attach(MIMEText(text, "plain"))
-    alt.attach(MIMEText(html_body, "html"))
-    msg.attach(alt)
-
-    # Attach signature image
-    if sig_path and os.path.exists(sig_path):
-        ctype, _ = mimetypes.guess_type(sig_path)
-        maintype, subtype = ctype.split("/", 1)
-        part = MIMEBase(maintype, subtype)
-        with open(sig_path, "rb") as f:
-            part.set_payload(f.read())
-        encoders.encode_base64(part)
-        part.add_header("Content-Disposition", f'attachment; filename="{os.path.basename(sig_path)}"')
-        msg.attach(part)
-
-    with smtplib.SMTP_SSL(smtp_server, smtp_port) as srv:
-        srv.login(sender, password)
-        srv.sendmail(sender, recipients, msg.as_string())
+media = svc.media
+store = media.store
+
+def save_upload(f):
+    with span("media_write"):
+        return media.save_upload(f)
+
+def show_video(value):
+    # stream from the store's URL when there is one; st.video(path) loads the
+    # whole file into memory, so only small files are inlined that way
+    p   = media.media_file(value)
+    url = store.url(p) if p and parse_ref(value) else None
+    if url:
+        st.video(url)
+    elif p and os.path.getsize(p) <= VIDEO_INLINE_MB * MB:
+        st.video(p)
+    else:
+        st.caption(f"🎞️ {media_name(value)} (too large to preview here)")
 
 # -----------------------------------------------------------------------------
 # 5) BRANDS & MODELS w/ “Other” option
@@ -157,22 +162,38 @@ for b, models in base_coffee_brands.items():
 coffee_brands["Other"] = ["Other"]
 brands = sorted(list(base_coffee_brands.keys())) + ["Other"]
 
+TECHNICIANS = ["Adonai Garcia","Miki Horvath"]
+
 current_year = datetime.now().year
-years = list(range(1970, current_year+1))[::-1]
+years = list(range(YEAR_MIN, current_year+1))[::-1]
 
 # -----------------------------------------------------------------------------
-# 6) GEOCODE once per customer
+# 6) GEOCODE: process-wide cache on disk + background batch geocoder
 # -----------------------------------------------------------------------------
-if "coords" not in st.session_state:
-    locator = Nominatim(user_agent="machine_logger")
-    cs = {}
-    for _, r in customers.iterrows():
-        try:
-            loc = locator.geocode(r["Address"], timeout=10)
-            cs[r["ID"]] = (loc.latitude, loc.longitude) if loc else (None, None)
-        except:
-            cs[r["ID"]] = (None, None)
-    st.session_state.coords = cs
+geo = svc.geo
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def customer_coords(versions):
+    # customer ID -> (lat, lon), and whether any of them is not stored in the
+    # table yet; once per customers/geocode version, which also seeds the
+    # cache from the table and queues the addresses it lacks
+    geo.seed(customers)
+    coords = geo.resolve(customers)
+    lat = pd.Series([coords[c][0] for c in customers["ID"]], index=customers.index, dtype="float64")
+    old_lat = (pd.to_numeric(customers["Latitude"], errors="coerce") if "Latitude" in customers
+               else pd.Series(float("nan"), index=customers.index))
+    return coords, bool((old_lat.isna() & lat.notna()).any())
+
+with span("geocode"):
+    coords, unsaved = customer_coords((db.customers.version, geo.version))
+
+# write resolved coordinates back into customers.csv when enabled
+if setting("geocode", "write_back", False) and unsaved:
+    def with_coords(df):
+        c = df["Address"].map(lambda a: geo.get(a) or (None, None))
+        return df.assign(Latitude=c.str[0].astype("float64"), Longitude=c.str[1].astype("float64"))
+    if db.customers.compact(with_coords):
+        push_to_github([CUSTOMERS_FILE, db.customers.journal], "Store customer coordinates")
 
 # -----------------------------------------------------------------------------
 # 7) APP STATE
@@ -184,43 +205,213 @@ mode = st.session_state.mode
 
 st.title("☕ Machine Hunter Service Logger")
 
+n_pending, unpushed, push_err, retry_at = svc.push.status()
+if push_err:
+    retry_in = max(0, int(retry_at - time.time())) if retry_at else 0
+    st.sidebar.error(f"⚠️ Sync to GitHub failed, retrying in {retry_in}s: {push_err}")
+elif n_pending or unpushed:
+    st.sidebar.info(f"⏳ {n_pending or 1} change(s) waiting to sync to GitHub")
+
+n_mail, n_dead = svc.outbox.counts()
+if n_dead:
+    st.sidebar.warning(f"✉️ {n_dead} email(s) could not be sent")
+    with st.sidebar.expander("Failed emails"):
+        for item in svc.outbox.dead_letters():
+            st.caption(f"{item['subject']} → {', '.join(item['recipients'])}: {item['error']}")
+        if st.button("Retry failed emails"):
+            svc.outbox.retry_dead()
+            st.rerun()
+elif n_mail:
+    st.sidebar.info(f"✉️ {n_mail} email(s) waiting to send")
+
+# -----------------------------------------------------------------------------
+# 7b) SEARCH: sidebar box over an incremental inverted index (machinelog/search.py);
+#     rows added since the last query are indexed before it runs
+# -----------------------------------------------------------------------------
+SEARCH_LIMIT = 8
+
+def open_customer(name, machine=None):
+    st.session_state.mode = "existing"
+    st.session_state.selected_customer = name
+    if machine:
+        st.session_state["machine"] = machine
+
+def company(cid):
+    c = db.customers.get("ID", cid)
+    return None if c is None else c["Company Name"]
+
+q = st.sidebar.text_input("🔎 Search jobs, machines, customers", key="search_q").strip()
+if q:
+    ix = svc.search
+    with span("search"):
+        ix.update({"customers": customers, "machines": machines, "jobs": jobs})
+        hits = {t: ix.search(q, t, SEARCH_LIMIT) for t in SEARCH_SPEC}
+    for pos in hits["customers"]:
+        c = customers.iloc[pos]
+        st.sidebar.button(f"👤 {c['Company Name']} · {c['Address']}", key=f"sr_c{pos}",
+                          on_click=open_customer, args=(c["Company Name"],))
+    for pos in hits["machines"]:
+        m = machines.iloc[pos]
+        label = f"{m['Brand']} ({m['Model']})"
+        name  = company(m["Customer ID"])
+        st.sidebar.button(f"⚙️ {label} · SN {m['Serial Number']} · {name}", key=f"sr_m{pos}",
+                          on_click=open_customer, args=(name, label), disabled=name is None)
+    for pos in hits["jobs"]:
+        j = jobs.iloc[pos]
+        m = db.machines.get("ID", j["Machine ID"])
+        label = None if m is None else f"{m['Brand']} ({m['Model']})"
+        name  = company(j["Customer ID"])
+        st.sidebar.button(f"🛠️ {j['Date']} · {str(j['Job Description'])[:40]} · {name}",
+                          key=f"sr_j{pos}", on_click=open_customer, args=(name, label),
+                          disabled=name is None)
+    if not any(hits.values()):
+        st.sidebar.caption("No matches.")
+
 # -----------------------------------------------------------------------------
 # 8) SELECT or ADD CUSTOMER
 # -----------------------------------------------------------------------------
 if mode == "select":
-    c1, c2 = st.columns([1,3])
+    c1, c2, c3 = st.columns([1,1,2])
     with c1:
         if st.button("➕ Add new customer"):
             st.session_state.mode = "add"
     with c2:
+        st.button("🧭 Plan a route", on_click=lambda: st.session_state.update(mode="route"))
+    with c3:
         st.markdown("**Or click a red dot to choose a customer**")
 
-    m = folium.Map(location=[43.7, -79.4], zoom_start=10, tiles="CartoDB positron")
-    fg = folium.FeatureGroup()
-    for cid,(lat,lon) in st.session_state.coords.items():
-        if lat and lon:
-            name = customers.loc[customers["ID"]==cid,"Company Name"].iat[0]
-            folium.CircleMarker([lat,lon], radius=6, color="red",
-                                fill=True, fill_color="red", tooltip=name).add_to(fg)
-    fg.add_to(m)
-    Search(layer=fg, search_label="tooltip", collapsed=False).add_to(m)
-    LocateControl(auto_start=False).add_to(m)
-
-    md = st_folium(m, width=700, height=400)
-    click = md.get("last_clicked")
-    if click:
-        best,bd=None,float("inf")
-        for cid,(clat,clon) in st.session_state.coords.items():
-            if clat and clon:
-                d=(clat-click["lat"])**2+(clon-click["lng"])**2
-                if d<bd:
-                    best,bd=cid,d
-        if best and bd<0.0005:
-            st.session_state.selected_customer = customers.loc[
-                customers["ID"]==best,"Company Name"
-            ].iat[0]
-            st.session_state.mode = "existing"
-    st.stop()
+    import folium
+    from folium.plugins import Search, LocateControl, MarkerCluster
+    from streamlit_folium import st_folium, generate_leaflet_string
+
+    @st.cache_resource(max_entries=2, show_spinner=False)
+    def located_points(versions):
+        # (ID, name, lat, lon) of the located customers; rebuilt when customers or coordinates change
+        coords = customer_coords(versions)[0]
+        points = []
+        for cid, name in customers[["ID","Company Name"]].itertuples(index=False):
+            lat, lon = coords[cid]
+            if lat and lon:
+                points.append((cid, name, lat, lon))
+        return points
+
+    @st.cache_resource(max_entries=2, show_spinner=False)
+    def customer_folium_map(version, _data):
+        # built and rendered once per layer version, shared by all sessions
+        m = folium.Map(location=[43.7, -79.4], zoom_start=10, tiles="CartoDB positron")
+        if _data["features"]:   # the tooltip and search need at least one feature
+            cluster = MarkerCluster(disable_clustering_at_zoom=15).add_to(m)
+            layer = folium.GeoJson(
+                _data,
+                marker=folium.CircleMarker(radius=6, color="red", fill=True, fill_color="red"),
+                tooltip=folium.GeoJsonTooltip(fields=["name"], labels=False),
+            ).add_to(cluster)
+            Search(layer=layer, search_label="name", collapsed=False).add_to(m)
+        LocateControl(auto_start=False).add_to(m)
+        m.get_root().render()
+        generate_leaflet_string(m)   # settles the element ids st_folium rewrites, so its widget key stays stable
+        return m, threading.Lock()
+
+    # while the background geocoder is still resolving, poll so pins appear
+    polling = geo.pending() > 0
+    @st.fragment(run_every=2 if polling else None)
+    def customer_map():
+        if geo.pending():
+            st.caption(f"Locating {geo.pending()} customer(s)…")
+        with span("map_build"):
+            # points, GeoJSON, click index and map are rebuilt only when the points change
+            points = located_points((db.customers.version, geo.version))
+            version, data, index = svc.map_layer.get(points)
+            m, lock = customer_folium_map(version, data)
+
+        with span("st_folium"):
+            # panning alone does not rerun the fragment; st_folium re-renders the shared map in place
+            with lock:
+                md = st_folium(m, width=700, height=400, returned_objects=["last_clicked", "zoom"], render=False)
+        click = md.get("last_clicked")
+        if click:
+            best = index.nearest(click["lat"], click["lng"], md.get("zoom") or 10)
+            if best:
+                st.session_state.selected_customer = company(best)
+                st.session_state.mode = "existing"
+                st.rerun()
+        if polling and not geo.pending():
+            st.rerun()  # geocoding finished: full rerun stops the polling
+
+    customer_map()
+    stop()
+
+# -----------------------------------------------------------------------------
+# 8b) ROUTE PLANNER: a technician's visits in a short driving order over the
+#     geocoded customers; leg times can be fitted to logged Travel Time
+#     (see machinelog/routes.py)
+# -----------------------------------------------------------------------------
+@st.cache_resource(max_entries=4, show_spinner=False)
+def travel_model(versions, tech, n_located):
+    # refitted when jobs/customers change or more addresses are located
+    from machinelog.routes import calibrate
+    return calibrate(db.jobs.df, coords, tech)
+
+if mode == "route":
+    from machinelog.routes import TravelModel, plan_route
+    st.header("🧭 Plan a Route")
+    st.button("⬅️ Back to map", on_click=lambda: st.session_state.update(mode="select"))
+
+    located = {cid: c for cid, c in coords.items() if c[0] is not None and c[1] is not None}
+    names   = customers.drop_duplicates("ID").set_index("ID")["Company Name"]
+    ids     = [cid for cid in names.index if cid in located]
+    techs   = sorted(set(TECHNICIANS) | set(jobs["Technician"].dropna().astype(str)) - {""})
+    tech    = st.selectbox("Technician", techs, key="rt_tech")
+    picked  = st.multiselect("Customers to visit", ids, format_func=names.get, key="rt_stops")
+    if len(ids) < len(names):
+        st.caption(f"{len(names) - len(ids)} customer(s) without a map location are not listed.")
+    r1, r2, r3 = st.columns(3)
+    first  = r1.selectbox("Start at", picked, format_func=names.get, key="rt_start")
+    closed = r2.toggle("Return to start", key="rt_closed")
+    fitted = r3.toggle("Use logged travel times", value=True, key="rt_fit")
+
+    if len(picked) < 2:
+        st.info("Pick at least two customers.")
+        stop()
+    model = (travel_model((db.jobs.version, db.customers.version), tech, len(located))
+             if fitted else TravelModel())
+    lat = [located[cid][0] for cid in picked]
+    lon = [located[cid][1] for cid in picked]
+    with span("route_plan"):
+        order, legs = plan_route(lat, lon, model,
+                                 picked.index(first) if first in picked else 0, closed)
+
+    visits = [picked[i] for i in order] + ([picked[order[0]]] if closed else [])
+    drive  = [0.0] + legs
+    plan = pd.DataFrame({
+        "Stop":        range(1, len(visits) + 1),
+        "Customer":    [names[cid] for cid in visits],
+        "Address":     [db.customers.get("ID", cid)["Address"] for cid in visits],
+        "Drive (min)": [round(x) for x in drive],
+        "Total (min)": [round(x) for x in pd.Series(drive).cumsum()],
+    })
+    k1, k2 = st.columns(2)
+    k1.metric("Stops", len(order))
+    k2.metric("Driving", f"{sum(legs) / 60:.1f} h")
+    st.caption(f"Leg time = {model.a:.0f} min + {model.b:.2f} min/km × straight-line km"
+               + (f", fitted to {model.legs} logged legs." if model.legs else " (default speed)."))
+    st.dataframe(plan, hide_index=True)
+
+    import folium
+    from streamlit_folium import st_folium
+    with span("map_build"):
+        path = [located[cid] for cid in visits]
+        m = folium.Map(location=path[0], zoom_start=10, tiles="CartoDB positron")
+        folium.PolyLine(path, color="red", weight=3, opacity=0.7).add_to(m)
+        for n, (cid, p) in enumerate(zip(visits[:len(order)], path), 1):
+            folium.Marker(p, tooltip=f"{n}. {names[cid]}", icon=folium.DivIcon(
+                html=f'<div style="background:red;color:white;border-radius:50%;width:22px;'
+                     f'height:22px;line-height:22px;text-align:center;font-weight:bold;">{n}</div>',
+                icon_size=(22, 22), icon_anchor=(11, 11))).add_to(m)
+        m.fit_bounds([[min(lat), min(lon)], [max(lat), max(lon)]])
+    with span("st_folium"):
+        st_folium(m, width=700, height=400, returned_objects=[], key="route_map")
+    stop()
 
 # -----------------------------------------------------------------------------
 # 9) ADD NEW CUSTOMER form
@@ -239,11 +430,11 @@ if mode == "add":
             errs = []
             if not cname.strip(): errs.append("Company Name required.")
             if not contact.strip(): errs.append("Contact Name required.")
-            if not re.match(r'.+\d+.+',addr) or len(addr.split())<3:
+            if not valid_address(addr):
                 errs.append("Valid address required.")
-            if not re.match(r'^\d{3}-\d{3}-\d{4}$',phone):
+            if not re.match(PHONE_RE,phone):
                 errs.append("Phone must be 000-000-0000.")
-            if not re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$',email):
+            if not re.match(EMAIL_RE,email):
                 errs.append("Valid email required.")
 
             if errs:
@@ -258,17 +449,15 @@ if mode == "add":
                     "Phone": phone.strip(),
                     "Email": email.strip()
                 }
-                customers = load_df(CUSTOMERS_FILE, CUSTOMERS_COLUMNS)
-                customers = pd.concat([customers, pd.DataFrame([new_row])], ignore_index=True)
-                customers.to_csv(CUSTOMERS_FILE, index=False)
-
-                push_to_github([CUSTOMERS_FILE], f"Add customer {cname.strip()}")
-
                 try:
-                    loc = locator.geocode(addr, timeout=10)
-                    st.session_state.coords[cid] = (loc.latitude,loc.longitude) if loc else (None,None)
-                except:
-                    st.session_state.coords[cid] = (None,None)
+                    files = db.customers.append(new_row)
+                except Conflict as e:    # saved from another session meanwhile
+                    st.error(str(e))
+                    stop()
+                push_to_github(files, f"Add customer {cname.strip()}")
+
+                # resolved in the background via the shared cache
+                geo.enqueue(addr.strip(), urgent=True)
 
                 st.session_state.mode = "select"
                 st.session_state.selected_customer = None
@@ -278,18 +467,18 @@ if mode == "add":
             if valid:
                 st.markdown(f"[Preview on Google Maps]"
                             f"(https://www.google.com/maps/search/{addr.replace(' ','+')})")
-    st.stop()
+    stop()
 
 # -----------------------------------------------------------------------------
 # 10) EXISTING CUSTOMER & Machine flow
 # -----------------------------------------------------------------------------
 sel_name = st.session_state.selected_customer
-if not sel_name or sel_name not in customers["Company Name"].tolist():
+cust = db.customers.get("Company Name", sel_name) if sel_name else None
+if cust is None:
     st.session_state.mode = "select"
     st.warning("Customer not found—please select again.")
-    st.stop()
+    stop()
 
-cust = customers.loc[customers["Company Name"]==sel_name].iloc[0]
 st.subheader("👤 Customer Information")
 st.text_input("Company Name", cust["Company Name"], disabled=True)
 st.text_input("Contact Name", cust["Contact Name"], disabled=True)
@@ -298,8 +487,8 @@ st.text_input("Phone",        cust["Phone"],        disabled=True)
 st.text_input("Email",        cust["Email"],        disabled=True)
 
 customer_id = cust["ID"]
-own = machines[machines["Customer ID"]==customer_id]
-labels = [f"{r.Brand} ({r.Model})" for _,r in own.iterrows()]
+own = db.machines.select("Customer ID", customer_id)
+labels = [f"{b} ({m})" for b, m in zip(own["Brand"], own["Model"])]
 mids   = own["ID"].tolist()
 sel_m  = st.selectbox("Select machine", ["Add new..."] + labels, key="machine")
 
@@ -330,38 +519,37 @@ if sel_m=="Add new...":
         if not fm:    errs.append("Model required.")
         if not st.session_state.yr: errs.append("Year required.")
         if not photo: errs.append("Photo required.")
+        else:         errs += media.check_upload_sizes([photo])
 
         if st.form_submit_button("Save Machine"):
             if errs:
                 st.error("\n".join(errs))
             else:
-                mid    = str(uuid.uuid4())
-                folder = os.path.join(MEDIA_ROOT, customer_id, "machines", mid)
-                os.makedirs(folder, exist_ok=True)
-                photo_path = os.path.join(folder, photo.name)
-                Image.open(photo).save(photo_path)
+                mid       = str(uuid.uuid4())
+                photo_ref = save_upload(photo)
 
-                new = pd.DataFrame([{
+                files = db.machines.append({
                     "ID": mid,
                     "Customer ID": customer_id,
                     "Brand": fb,
                     "Model": fm,
                     "Year": st.session_state.yr,
                     "Serial Number": serial,
-                    "Photo Path": photo_path,
+                    "Photo Path": photo_ref,
                     "Observations": obs
-                }])
-                machines = pd.concat([machines, new], ignore_index=True)
-                machines.to_csv(MACHINES_FILE, index=False)
+                })
 
-                push_to_github([MACHINES_FILE, photo_path],
+                push_to_github(files,
                                f"Add machine {fm} for {sel_name}")
+                media.submit_derivatives([photo_ref])   # best effort, once the row is saved
 
                 st.success("Machine added!")
                 st.rerun()
 
 # --- VIEW & LOG JOB for existing machine ---
 else:
+    from streamlit_drawable_canvas import st_canvas
+
     idx  = labels.index(sel_m)
     mrow = own.iloc[idx]
     st.subheader("☕ Machine Information")
@@ -370,12 +558,13 @@ else:
     st.text_input("Year",          mrow["Year"],  disabled=True)
     st.text_input("Serial Number", mrow.get("Serial Number",""), disabled=True)
     st.text_area("Observations",   mrow.get("Observations",""),  disabled=True)
-    if os.path.exists(mrow["Photo Path"]):
-        st.image(mrow["Photo Path"], caption="Machine Photo", width=200)
+    photo_src = media.preview_path(mrow["Photo Path"])
+    if photo_src:
+        st.image(photo_src, caption="Machine Photo", width=200)
 
     st.subheader("📝 Log a Job")
     with st.form("log_job"):
-        tech   = st.selectbox("Technician*", ["Adonai Garcia","Miki Horvath"])
+        tech   = st.selectbox("Technician*", TECHNICIANS)
         jdate  = st.date_input("Date*", datetime.now())
         travel = st.number_input("Travel Time (min)*", 0, step=1)
         tin    = st.time_input("Time In*")
@@ -407,38 +596,31 @@ else:
         if st.form_submit_button("Submit Job"):
             ok = all([tech, desc.strip(), emp.strip(),
                       found_files, left_files, sigimg.image_data is not None])
+            size_errs = media.check_upload_sizes((found_files or []) + (left_files or []))
             if not ok:
                 st.error("Complete all required fields & uploads.")
+            elif size_errs:
+                st.error("\n".join(size_errs))
             else:
                 jid = str(uuid.uuid4())
-                # prepare folders
-                job_folder       = os.path.join(MEDIA_ROOT, customer_id, "jobs", jid)
-                found_folder     = os.path.join(job_folder, "found")
-                left_folder      = os.path.join(job_folder, "left")
-                signature_folder = os.path.join(job_folder, "signature")
-                for d in (found_folder, left_folder, signature_folder):
-                    os.makedirs(d, exist_ok=True)
-
-                # save found media
-                found_paths = []
-                for f in found_files:
-                    p = os.path.join(found_folder, f.name)
-                    with open(p, "wb") as out: out.write(f.read())
-                    found_paths.append(p)
-
-                # save left media
-                left_paths = []
-                for f in left_files:
-                    p = os.path.join(left_folder, f.name)
-                    with open(p, "wb") as out: out.write(f.read())
-                    left_paths.append(p)
+                # save found / left media into the blob store
+                try:
+                    found_refs = [save_upload(f) for f in found_files]
+                    left_refs  = [save_upload(f) for f in left_files]
+                except BlobTooLarge as e:
+                    st.error(str(e))
+                    stop()
 
                 # save signature
-                sig_path = os.path.join(signature_folder, f"{jid}_sig.png")
-                Image.fromarray(sigimg.image_data).save(sig_path)
+                from PIL import Image
+                with span("media_write"):
+                    tmp = store.staging_path()
+                    Image.fromarray(sigimg.image_data).save(tmp, format="PNG")
+                    sig_ref  = store.put(tmp, f"{jid}_sig.png", move=True)
+                sig_path = store.path(sig_ref)
 
                 # update jobs.csv
-                newj = pd.DataFrame([{
+                job = {
                     "Job ID":               jid,
                     "Customer ID":          customer_id,
                     "Machine ID":           mids[idx],
@@ -451,117 +633,244 @@ else:
                     "Job Description":      desc,
                     "Parts Used":           parts,
                     "Additional Comments":  comm,
-                    "Machine as Found Paths": ";".join(found_paths),
-                    "Machine as Left Paths":  ";".join(left_paths),
-                    "Signature Path":        sig_path
-                }])
-                jobs = pd.concat([jobs, newj], ignore_index=True)
-                jobs.to_csv(JOBS_FILE, index=False)
+                    "Machine as Found Paths": ";".join(found_refs),
+                    "Machine as Left Paths":  ";".join(left_refs),
+                    "Signature Path":        sig_ref
+                }
+                files = db.jobs.append(job)
 
-                # commit CSV + all media
-                all_files = [JOBS_FILE] + found_paths + left_paths + [sig_path]
-                push_to_github(all_files, f"Log job {jid} for {sel_name}")
+                # commit the journal only; media lives in the blob store
+                push_to_github(files, f"Log job {jid} for {sel_name}")
+
+                # web/thumbnail versions of the photos, built off the request path
+                # once the row is saved (best effort)
+                derived = media.submit_derivatives(found_refs + left_refs)
 
                 st.success("Job logged successfully!")
 
-                # prepare raw link base for GitHub
-                raw_base = f"https://raw.githubusercontent.com/{st.secrets['github']['repo']}/{st.secrets['github']['branch']}"
-
-                # build HTML for customer email
-                customer_links_html = "".join(
-                    f'<li><a href="{raw_base}/{p.replace(os.sep,"/")}">{os.path.basename(p)}</a></li>'
-                    for p in left_paths
-                )
-                html_customer = f"""
-<p>Dear {cust['Contact Name']},</p>
-<p>Thank you for choosing Machine Hunter for your service needs. Below are your job details:</p>
-<ul>
-  <li><strong>Job ID:</strong> {jid}</li>
-  <li><strong>Customer:</strong> {sel_name}</li>
-  <li><strong>Machine:</strong> {sel_m}</li>
-  <li><strong>Employee:</strong> {emp}</li>
-  <li><strong>Technician:</strong> {tech}</li>
-  <li><strong>Date:</strong> {jdate}</li>
-  <li><strong>Description:</strong> {desc}</li>
-  {f"<li><strong>Additional Comments:</strong> {comm}</li>" if comm else ""}
-</ul>
-<p><strong>Signature:</strong> attached.</p>
-<p><strong>Machine as it was left:</strong></p>
-<ul>
-  {customer_links_html}
-</ul>
-<p>Please find attached your employee's signature and the multimedia of the machine as it was left by our technician.</p>
-<p>We appreciate your business and look forward to serving you again.<p>
-<p>Sincerely,<br/>Machine Hunter Service Team</p>
-"""
-
-                # send customer email
-                send_email(
-                    recipients=[cust["Email"]],
-                    subject=f"Service Job Confirmation – {jid}",
-                    html_body=html_customer,
-                    sig_path=sig_path
-                )
-
-                # build HTML for internal email
-                internal_links_html = customer_links_html
-                html_internal = f"""
-<p>New service job logged:</p>
-<ul>
-  <li><strong>Job ID:</strong> {jid}</li>
-  <li><strong>Customer:</strong> {sel_name}</li>
-  <li><strong>Machine:</strong> {sel_m}</li>
-  <li><strong>Employee:</strong> {emp}</li>
-  <li><strong>Technician:</strong> {tech}</li>
-  <li><strong>Date:</strong> {jdate}</li>
-  <li><strong>Travel Time:</strong> {travel} minutes</li>
-  <li><strong>Time In:</strong> {tin}</li>
-  <li><strong>Time Out:</strong> {tout}</li>
-  <li><strong>Description:</strong> {desc}</li>
-  {f"<li><strong>Parts Used:</strong> {parts}</li>" if parts else ""}
-  {f"<li><strong>Additional Comments:</strong> {comm}</li>" if comm else ""}
-</ul>
-<p><strong>Signature:</strong> attached.</p>
-<p><strong>Machine as it was left:</strong></p>
-<ul>
-  {internal_links_html}
-</ul>
-"""
-
-                # send internal email to the address in secrets
-                send_email(
-                    recipients=[st.secrets["email"]["user"]],
-                    subject=f"Service Job Logged – {jid}",
-                    html_body=html_internal,
-                    sig_path=sig_path
-                )
+                # customer + internal emails, queued now and sent with the
+                # HTML/PDF service report once the media pool has rendered it
+                # (links need [media] public_url)
+                for err in svc.notify_job(job, cust, sel_m):
+                    st.warning(f"Email not queued – {err}")
+
+                # thumbnails once the pool has built them, the originals until then
+                def small(ref, kind):
+                    f = derived.get(ref)
+                    ok = f is not None and f.done() and f.exception() is None
+                    return derivative_path(store.path(ref), kind) if ok else store.path(ref)
 
                 # In‑app preview
                 st.markdown("### Preview")
+                st.caption("The service report is attached to the emails once it is rendered.")
                 st.image(sig_path, caption="Technician’s Signature", width=150)
                 st.markdown("**Machine as Found:**")
-                for p in found_paths:
-                    if p.lower().endswith(".mp4"):
-                        st.video(p)
+                for r in found_refs:
+                    if is_video(r):
+                        show_video(r)
                     else:
-                        st.image(p, caption=os.path.basename(p), width=150)
+                        st.image(small(r, "thumb"), caption=media_name(r), width=150)
                 st.markdown("**Machine as Left:**")
-                for p in left_paths:
-                    if p.lower().endswith(".mp4"):
-                        st.video(p)
+                for r in left_refs:
+                    if is_video(r):
+                        show_video(r)
                     else:
-                        st.image(p, caption=os.path.basename(p), width=150)
+                        st.image(small(r, "thumb"), caption=media_name(r), width=150)
 
 # -----------------------------------------------------------------------------
-# 11) ADMIN TABS: show full tables
+# 11) ADMIN TABLES: rendered only when picked; filtered, sorted and paged
+#     server-side so each page sends at most ADMIN_PAGE_SIZE rows
 # -----------------------------------------------------------------------------
-tab1, tab2, tab3 = st.tabs(['All Jobs','All Customers','All Machines'])
-with tab1:
+ADMIN_PAGE_SIZE = 50
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def joined_jobs(versions):
+    # jobs with customer/machine names resolved; rebuilt when any table changes
+    j, c, m = db.jobs.df, db.customers.df, db.machines.df
+    names  = c.drop_duplicates("ID").set_index("ID")["Company Name"]
+    mm     = m.drop_duplicates("ID").set_index("ID")
+    labels = mm["Brand"].astype(str) + " (" + mm["Model"].astype(str) + ")"
+    v = j.assign(**{
+        "Customer": j["Customer ID"].map(names),
+        "Machine":  j["Machine ID"].map(labels),
+        "Date":     pd.to_datetime(j["Date"], errors="coerce"),
+    })
+    first = ["Date","Customer","Machine","Technician","Employee Name","Travel Time (min)",
+             "Time In","Time Out","Job Description","Parts Used","Additional Comments"]
+    v = v[first + [col for col in v.columns if col not in first]]
+    techs = sorted(v["Technician"].dropna().astype(str).unique())
+    return v, techs
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def joined_machines(versions):
+    m, c = db.machines.df, db.customers.df
+    names = c.drop_duplicates("ID").set_index("ID")["Company Name"]
+    v = m.assign(Customer=m["Customer ID"].map(names))
+    return v[["Customer"] + [col for col in v.columns if col != "Customer"]]
+
+def text_mask(df, cols, q):
+    mask = pd.Series(False, index=df.index)
+    for col in cols:
+        mask |= df[col].astype(str).str.contains(q, case=False, na=False, regex=False)
+    return mask
+
+def paged_table(df, key, sort_default):
+    c1, c2, c3 = st.columns([2,1,1])
+    sort_col = c1.selectbox("Sort by", list(df.columns),
+                            index=list(df.columns).index(sort_default), key=f"{key}_sort")
+    desc  = c2.toggle("Descending", value=True, key=f"{key}_desc")
+    pages = max(1, -(-len(df) // ADMIN_PAGE_SIZE))
+    page  = c3.number_input("Page", 1, pages, 1, key=f"{key}_page")
+    start = (page - 1) * ADMIN_PAGE_SIZE
+    rows  = df.sort_values(sort_col, ascending=not desc, kind="stable").iloc[start:start + ADMIN_PAGE_SIZE]
+    st.caption(f"{len(df)} row(s) · page {page} of {pages}")
+    st.dataframe(rows, hide_index=True)
+    # filtered rows, all pages; built only when clicked
+    st.download_button("⬇️ Export CSV", data=lambda: csv_bytes(df), file_name=f"{key}.csv",
+                       mime="text/csv", key=f"{key}_export", on_click="ignore")
+
+st.divider()
+admin = st.segmented_control("Admin", ["All Jobs","All Customers","All Machines","Analytics",
+                                      "Import","Integrity"], key="admin_view")
+versions = (db.jobs.version, db.customers.version, db.machines.version)
+
+if admin == "All Jobs":
     st.header('All Job Logs')
-    st.dataframe(jobs)
-with tab2:
+    v, techs = joined_jobs(versions)
+    f1, f2 = st.columns(2)
+    f_tech  = f1.multiselect("Technician", techs, key="jf_tech")
+    f_dates = f2.date_input("Date range", value=(), key="jf_dates")
+    f3, f4 = st.columns(2)
+    f_cust  = f3.text_input("Customer contains", key="jf_cust").strip()
+    f_mach  = f4.text_input("Machine contains", key="jf_mach").strip()
+    mask = pd.Series(True, index=v.index)
+    if f_tech:
+        mask &= v["Technician"].isin(f_tech)
+    if len(f_dates) == 2:
+        mask &= v["Date"].between(pd.Timestamp(f_dates[0]), pd.Timestamp(f_dates[1]))
+    if f_cust:
+        mask &= text_mask(v, ["Customer"], f_cust)
+    if f_mach:
+        mask &= text_mask(v, ["Machine"], f_mach)
+    paged_table(v[mask], "jobs", "Date")
+elif admin == "All Customers":
     st.header('All Customers')
-    st.dataframe(customers)
-with tab3:
+    q = st.text_input("Search", key="cf_q").strip()
+    v = db.customers.df
+    paged_table(v[text_mask(v, ["Company Name","Contact Name","Address","Email"], q)] if q else v,
+                "customers", "Company Name")
+elif admin == "All Machines":
     st.header('All Machines')
-    st.dataframe(machines)
+    q = st.text_input("Search", key="mf_q").strip()
+    v = joined_machines(versions)
+    paged_table(v[text_mask(v, ["Customer","Brand","Model","Serial Number"], q)] if q else v,
+                "machines", "Customer")
+elif admin == "Analytics":
+    st.header('Service Analytics')
+    rollups = svc.rollups
+    with span("analytics"):
+        rollups.update(db.jobs.df)    # folds in only jobs logged since the last view
+    names  = db.customers.df.drop_duplicates("ID").set_index("ID")["Company Name"]
+    mm     = db.machines.df.drop_duplicates("ID").set_index("ID")
+    labels = mm["Brand"].astype(str) + " (" + mm["Model"].astype(str) + ")"
+    tech, month = rollups.table("tech"), rollups.table("month")
+    k1, k2, k3 = st.columns(3)
+    k1.metric("Jobs", int(tech["Jobs"].sum()))
+    k2.metric("On-site hours", f"{tech['On-site (min)'].sum() / 60:,.0f}")
+    k3.metric("Travel hours", f"{tech['Travel (min)'].sum() / 60:,.0f}")
+    if len(month):
+        st.bar_chart(month["Jobs"])
+    hidden = ["On-site (min)", "Timed jobs", "Travel (min)", "Travel jobs"]
+    t1, t2, t3, t4 = st.tabs(["Technicians", "Customers", "Machines", "Parts"])
+    with t1:
+        st.dataframe(tech.assign(**{"On-site hours": (tech["On-site (min)"] / 60).round(1)})
+                     .drop(columns=hidden))
+    with t2:
+        c = rollups.table("customer").drop(columns=hidden)
+        c.insert(0, "Customer", names.reindex(c.index).to_numpy())
+        paged_table(c, "an_customers", "Jobs")
+    with t3:
+        m = rollups.table("machine").drop(columns=hidden)
+        m.insert(0, "Machine", labels.reindex(m.index).to_numpy())
+        m.insert(1, "Customer", mm["Customer ID"].reindex(m.index).map(names).to_numpy())
+        m["Days since last visit"] = (pd.Timestamp.now() - m["Last visit"]).dt.days
+        paged_table(m, "an_machines", "Jobs")
+    with t4:
+        paged_table(rollups.table("parts").reset_index(), "an_parts", "Quantity")
+elif admin == "Import":
+    st.header('Bulk Import')
+    st.caption("CSV or Excel with the table's column names. Machines and jobs name their "
+               "customer by Customer ID or Company Name; jobs their machine by Machine ID "
+               "or Serial Number. IDs are assigned when left out.")
+    kind = st.selectbox("Records", list(KINDS), key="imp_kind", format_func=str.title)
+    # a fresh uploader key after each import, so a batch cannot be imported twice
+    n_imp = st.session_state.setdefault("imp_n", 0)
+    if "imp_done" in st.session_state:
+        st.success(st.session_state.pop("imp_done"))
+    up   = st.file_uploader("Batch file", type=["csv","xlsx","xls"], key=f"imp_file{n_imp}")
+    if up:
+        try:
+            batch = read_batch(up, up.name)
+        except ValueError as e:
+            st.error(str(e))
+            batch = None
+    if up and batch is not None:
+        tables = db.tables()
+        rows, errors = validate(kind, batch, {k: t.df for k, t in tables.items()})
+        st.caption(f"{len(batch)} row(s) read · {len(rows)} valid · "
+                   f"{errors['Row'].nunique()} with errors")
+        if len(errors):
+            st.dataframe(errors, hide_index=True)
+        skip = st.checkbox("Import the valid rows anyway", key="imp_skip") if len(errors) else True
+        if st.button(f"Import {len(rows)} {kind}", disabled=not len(rows) or not skip):
+            with span("bulk_import"):
+                try:
+                    files = import_rows(tables[kind], rows)
+                except Conflict as e:
+                    st.error(f"Nothing imported, the table changed meanwhile: {e}")
+                    stop()
+                push_to_github(files, f"Import {len(rows)} {kind} from {up.name}")
+                if kind == "customers":
+                    for addr in rows["Address"]:
+                        geo.enqueue(addr)    # background batch geocoder
+            st.session_state.imp_n    = n_imp + 1
+            st.session_state.imp_done = f"Imported {len(rows)} {kind}."
+            st.rerun()
+elif admin == "Integrity":
+    from machinelog.integrity import scan, repair, tracked_files
+    from machinelog.media import MEDIA_ROOT
+    st.header('Data Integrity')
+    st.caption("Checks every media path, blob reference and customer/machine ID against one "
+               "scan of the media folders (see machinelog/integrity.py).")
+    if "ig_done" in st.session_state:
+        st.success(st.session_state.pop("ig_done"))
+    by_hash = st.toggle("Also match files by content (reads every file)", key="ig_hash")
+    if st.button("Scan"):
+        with span("integrity_scan"):
+            tracked = tracked_files(MEDIA_ROOT) if repo_sync.sparse else ()
+            st.session_state.ig_scan = scan({k: t.refresh() for k, t in db.tables().items()},
+                                            store, by_hash=by_hash, tracked=tracked)
+    res = st.session_state.get("ig_scan")
+    if res is not None:
+        issues = res.issue_frame()
+        k1, k2, k3, k4 = st.columns(4)
+        k1.metric("Files", f"{res.files + res.blobs:,}")
+        k2.metric("Issues", len(issues))
+        k3.metric("Fixable", res.fixable())
+        k4.metric("Orphans", len(res.orphans))
+        st.caption(f"Scanned in {res.seconds:.1f}s")
+        if len(issues):
+            paged_table(issues, "ig_issues", "Problem")
+        if res.orphans:
+            with st.expander(f"Files no row references ({len(res.orphans)})"):
+                paged_table(res.orphan_frame(), "ig_orphans", "Path")
+        if (res.fixable() or res.legacy) and st.button(f"Apply {res.fixable()} fix(es)"):
+            with span("integrity_repair"):
+                files = repair(db.tables(), res, store)
+            if files:
+                push_to_github(files, "Repair media references")
+            del st.session_state.ig_scan
+            st.session_state.ig_done = f"Applied {res.fixable()} fix(es)."
+            st.rerun()
+
+show_timings()
@@ -0,0 +1,7 @@
+# -----------------------------------------------------------------------------
+# Machine Logger core: data model, validation, media, git sync and email,
+# importable without Streamlit. Heavy dependencies (GitPython, geopy, PIL,
+# folium) load inside the functions that use them, so importing a module here
+# costs little more than pandas. machine_logger.py is the Streamlit page on
+# top; api.py serves the same operations over local HTTP/JSON.
+# -----------------------------------------------------------------------------
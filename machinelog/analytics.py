@@ -0,0 +1,152 @@
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# Service analytics kept as rollups over jobs.csv. The jobs table only grows at
+# the end (journal appends, compaction keeps the order), so update() folds just
+# the rows it has not seen yet into small per-group aggregates and never
+# rescans the history. If the table shrank or was rewritten, it rebuilds.
+# Every aggregate is a sum/min/max, so merging a batch is a groupby over
+# (old groups + new groups) instead of over all jobs.
+# -----------------------------------------------------------------------------
+ROLLUP_FORMAT = 1
+PART_RE  = r"^\s*(?:(\d+(?:\.\d+)?)\s*(?:x|pcs?\.?)?\s+)?(.+?)\s*$"
+PART_SEP = r"[\n;,]+"
+
+SUMS   = {"Jobs": "sum", "On-site (min)": "sum", "Timed jobs": "sum",
+          "Travel (min)": "sum", "Travel jobs": "sum"}
+ROLLUP_AGGS = {
+    "tech":     SUMS,
+    "customer": SUMS,
+    "machine":  {**SUMS, "First visit": "min", "Last visit": "max"},
+    "month":    SUMS,
+    "parts":    {"Quantity": "sum", "Jobs": "sum"},
+}
+
+def minutes(col):
+    # "HH:MM[:SS]" -> minutes since midnight (NaN if unparseable)
+    s = col.astype(str).str.strip()
+    s = s.where(s.str.count(":") != 1, s + ":00")
+    return pd.to_timedelta(s, errors="coerce").dt.total_seconds() / 60
+
+def job_metrics(jobs):
+    # one row per job with numeric on-site/travel minutes and a parsed date
+    on_site = minutes(jobs["Time Out"]) - minutes(jobs["Time In"])
+    on_site = on_site.where(on_site >= 0, on_site + 24 * 60)     # ran past midnight
+    travel  = pd.to_numeric(jobs["Travel Time (min)"], errors="coerce")
+    date    = pd.to_datetime(jobs["Date"], errors="coerce", format="ISO8601")
+    return pd.DataFrame({
+        "Technician":    jobs["Technician"].fillna("").astype(str),
+        "Customer ID":   jobs["Customer ID"],
+        "Machine ID":    jobs["Machine ID"],
+        "Month":         date.dt.to_period("M").astype(str),
+        "Date":          date,
+        "Jobs":          1,
+        "On-site (min)": on_site.fillna(0),
+        "Timed jobs":    on_site.notna().astype(int),
+        "Travel (min)":  travel.fillna(0),
+        "Travel jobs":   travel.notna().astype(int),
+    }, index=jobs.index)
+
+def normalize_part(name):
+    # "Gaskets" / "gasket" -> "gasket"
+    name = name.str.lower().str.replace(r"\s+", " ", regex=True).str.strip(" .-")
+    return name.where(~name.str.contains(r"[^s]s$") | (name.str.len() <= 3), name.str[:-1])
+
+def parse_parts(col):
+    # free-text "2 gaskets\n1 water pump" -> rows (job index, Part, Quantity)
+    lines = col.dropna().astype(str).str.split(PART_SEP).explode()
+    lines = lines[lines.str.strip() != ""]
+    m = lines.str.extract(PART_RE)
+    return pd.DataFrame({"Part": normalize_part(m[1].fillna("")),
+                         "Quantity": pd.to_numeric(m[0], errors="coerce").fillna(1)})
+
+def merge(old, new, how):
+    if old is None or old.empty:
+        return new
+    return pd.concat([old, new]).groupby(level=0, sort=False).agg(how)
+
+class Rollups:
+    def __init__(self, path=None, key="Job ID"):
+        self.path    = path
+        self.key     = key
+        self.lock    = threading.Lock()
+        self.version = 0
+        self._reset()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    state = pickle.load(f)
+                if state.get("format") == ROLLUP_FORMAT:
+                    self.n, self.last_key, self.tables = state["n"], state["last_key"], state["tables"]
+            except Exception:
+                self._reset()
+
+    def _reset(self):
+        self.n, self.last_key, self.tables = 0, None, {}
+
+    def update(self, jobs):
+        # fold rows appended since the last call; True if anything changed
+        with self.lock:
+            n = self.n
+            if n > len(jobs) or (n and jobs[self.key].iat[n - 1] != self.last_key):
+                self._reset()
+                n = 0
+            if n == len(jobs):
+                return False
+            self._add(jobs.iloc[n:])
+            self.n, self.last_key = len(jobs), jobs[self.key].iat[-1]
+            self.version += 1
+            self._save()
+            return True
+
+    def _add(self, new):
+        m = job_metrics(new)
+        cols = list(SUMS)
+        batches = {
+            "tech":     m.groupby("Technician", sort=False)[cols].sum(),
+            "customer": m.groupby("Customer ID", sort=False)[cols].sum(),
+            "month":    m.dropna(subset=["Date"]).groupby("Month", sort=False)[cols].sum(),
+            "machine":  m.groupby("Machine ID", sort=False).agg(
+                **{c: (c, "sum") for c in cols},
+                **{"First visit": ("Date", "min"), "Last visit": ("Date", "max")}),
+        }
+        parts = parse_parts(new["Parts Used"])
+        if len(parts):
+            per_job = parts.groupby([parts.index, "Part"], sort=False)["Quantity"].sum()
+            batches["parts"] = per_job.groupby(level="Part", sort=False).agg(
+                Quantity="sum", Jobs="size")
+        for name, b in batches.items():
+            self.tables[name] = merge(self.tables.get(name), b, ROLLUP_AGGS[name])
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"format": ROLLUP_FORMAT, "n": self.n, "last_key": self.last_key,
+                         "tables": self.tables}, f)
+        os.replace(tmp, self.path)
+
+    def table(self, name):
+        # rollup with derived averages; empty (but typed) before the first job
+        with self.lock:
+            t = self.tables.get(name)
+        if t is None:
+            t = pd.DataFrame({c: pd.Series(dtype="datetime64[ns]" if how in ("min", "max") else "float64")
+                              for c, how in ROLLUP_AGGS[name].items()})
+        if name == "parts":
+            return t.sort_values("Quantity", ascending=False)
+        t = t.assign(**{
+            "Avg on-site (min)": (t["On-site (min)"] / t["Timed jobs"].replace(0, np.nan)).round(1),
+            "Avg travel (min)":  (t["Travel (min)"] / t["Travel jobs"].replace(0, np.nan)).round(1),
+        })
+        if name == "machine":
+            span = (t["Last visit"] - t["First visit"]).dt.days
+            t = t.assign(**{"Avg days between visits":
+                            (span / (t["Jobs"] - 1).replace(0, np.nan)).round(1)})
+        return t.sort_index() if name == "month" else t.sort_values("Jobs", ascending=False)
@@ -0,0 +1,243 @@
+import sys
+import hmac
+import json
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import pandas as pd
+
+from . import perf
+from .config import Settings
+from .services import Services
+from .blobstore import BlobTooLarge, parse_ref
+from .datastore import MEDIA_COLUMNS, Conflict
+from .bulk import KINDS, col, validate, import_rows, records, filter_rows
+from .media import MB
+
+# -----------------------------------------------------------------------------
+# Local HTTP/JSON API for logging jobs (and customers/machines) and uploading
+# media without the UI. Rows go through the same validation as Bulk Import and
+# the same journal + git push queue as the page, and can run next to it (see
+# lease.py). Run in the data directory:
+#   python -m machinelog.api [--host 127.0.0.1] [--port 8765]
+#
+#   GET  /health                            row counts
+#   GET  /jobs?since=&until=&tech=&customer=&offset=&limit=
+#   GET  /customers, /machines              (same filters where they apply)
+#   POST /media?name=IMG_1.jpg              raw bytes -> {"ref": "blob:..."}
+#   POST /jobs?skip_invalid=1&notify=1      JSON object or list of objects
+#   POST /customers, /machines
+#
+# Media cells take the refs returned by POST /media (";"-separated for the
+# found/left lists). notify=1 sends the customer + internal job emails
+# ("email_errors" lists any that could not be queued).
+# [api] token = "..." requires "Authorization: Bearer <token>".
+# -----------------------------------------------------------------------------
+API_HOST      = "127.0.0.1"
+API_PORT      = 8765
+API_PAGE_SIZE = 500
+MAX_JSON_MB   = 20
+
+class ApiError(Exception):
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.body   = {"error": message, **extra}
+
+class Body:
+    # request body as a file object that stops at Content-Length
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.left  = length
+
+    def read(self, n=-1):
+        if self.left <= 0:
+            return b""
+        data = self.rfile.read(self.left if n is None or n < 0 else min(n, self.left))
+        self.left -= len(data)
+        return data
+
+def flag(items):
+    # true for query values like 1 / true / yes
+    return bool(items) and items[-1].lower() in ("1", "true", "yes")
+
+def frame(items):
+    # JSON rows -> all-text DataFrame, like a CSV read by bulk.read_batch
+    df = pd.DataFrame(items, dtype=object)
+    df.columns = [str(c).strip() for c in df.columns]
+    return df.where(df.notna(), "").astype(str).apply(lambda c: c.str.strip())
+
+def error_list(errors):
+    # bulk reports spreadsheet lines (header = 1); the API reports list positions
+    return [{"item": int(r) - 2, "column": c, "error": e}
+            for r, c, e in errors.itertuples(index=False)]
+
+def check_media(kind, df, store):
+    # media cells must name blobs already uploaded through POST /media
+    bad = []
+    for c in MEDIA_COLUMNS.get(kind, []):
+        for i, cell in col(df, c).items():
+            for ref in filter(None, str(cell).split(";")):
+                if not parse_ref(ref) or store.path(ref) is None:
+                    bad.append({"Row": i + 2, "Column": c, "Error": f"Unknown media reference {ref}."})
+    return pd.DataFrame(bad, columns=["Row", "Column", "Error"])
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "MachineLogger/1"
+
+    def send(self, status, body):
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def length(self, limit):
+        n = self.headers.get("Content-Length")
+        if n is None:
+            raise ApiError(411, "Content-Length required.")
+        if int(n) > limit:
+            raise ApiError(413, f"Request body is larger than {limit // MB} MB.")
+        return int(n)
+
+    def route(self, method):
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get("Authorization", ""),
+                                             f"Bearer {token}"):
+            raise ApiError(401, "Missing or wrong API token.")
+        url   = urlsplit(self.path)
+        query = parse_qs(url.query)
+        name  = url.path.strip("/")
+        if method == "GET" and name == "health":
+            return 200, self.health()
+        if method == "GET" and name in KINDS:
+            return 200, self.list_rows(name, query)
+        if method == "POST" and name == "media":
+            return 201, self.upload(query)
+        if method == "POST" and name in KINDS:
+            return 201, self.create(name, query)
+        raise ApiError(404, f"No route for {method} {url.path}.")
+
+    def handle_method(self, method):
+        try:
+            with perf.span(f"api_{method.lower()}"):
+                status, body = self.route(method)
+        except ApiError as e:
+            status, body = e.status, e.body
+        except Exception as e:
+            status, body = 500, {"error": f"{type(e).__name__}: {e}"}
+        if status >= 400:
+            self.close_connection = True   # the body may be partly unread
+        self.send(status, body)
+
+    def do_GET(self):
+        self.handle_method("GET")
+
+    def do_POST(self):
+        self.handle_method("POST")
+
+    # --- endpoints ---------------------------------------------------------
+    def health(self):
+        db = self.server.services.db
+        return {"ok": True, "rows": {k: len(t.refresh()) for k, t in db.tables().items()}}
+
+    def list_rows(self, kind, query):
+        arg  = lambda k: query.get(k, [None])[-1]
+        data = {k: t.refresh() for k, t in self.server.services.db.tables().items()}
+        try:
+            df    = filter_rows(kind, data, arg("since"), arg("until"), arg("tech"), arg("customer"))
+            start = int(arg("offset") or 0)
+            limit = int(arg("limit") or API_PAGE_SIZE)
+        except ValueError as e:
+            raise ApiError(400, str(e))
+        return {"total": len(df), "offset": start, "rows": records(df.iloc[start:start + limit])}
+
+    def upload(self, query):
+        name = query.get("name", [""])[-1].strip()
+        if not name:
+            raise ApiError(400, "name= (the original file name) required.")
+        media = self.server.services.media
+        n = self.length(media.max_file_mb * MB)
+        if not n:
+            raise ApiError(400, "Empty upload.")
+        try:
+            ref, size = media.save_stream(Body(self.rfile, n), name)
+        except BlobTooLarge as e:
+            raise ApiError(413, str(e))
+        media.submit_derivatives([ref])
+        return {"ref": ref, "size": size}
+
+    def create(self, kind, query):
+        try:
+            items = json.loads(self.rfile.read(self.length(MAX_JSON_MB * MB)) or b"null")
+        except ValueError as e:
+            raise ApiError(400, f"Invalid JSON: {e}")
+        items = [items] if isinstance(items, dict) else items
+        if not isinstance(items, list) or not items or not all(isinstance(i, dict) for i in items):
+            raise ApiError(400, "Expected a JSON object or a non-empty list of objects.")
+
+        svc = self.server.services
+        # one writer at a time, so two requests cannot both claim a new ID/name
+        with self.server.write_lock:
+            tables = svc.db.tables()
+            data   = {k: t.refresh() for k, t in tables.items()}
+            df = frame(items)
+            rows, errors = validate(kind, df, data)
+            bad = check_media(kind, df, svc.media.store)
+            if len(bad):
+                rows   = rows[~rows.index.isin(bad["Row"] - 2)]
+                errors = pd.concat([errors, bad], ignore_index=True).sort_values("Row", kind="stable")
+            if len(errors) and (not flag(query.get("skip_invalid")) or not len(rows)):
+                raise ApiError(422, "Validation failed; nothing was imported.",
+                               errors=error_list(errors))
+            try:
+                files = import_rows(tables[kind], rows)
+            except Conflict as e:
+                raise ApiError(409, str(e))
+        svc.push_to_github(files, f"Log {len(rows)} {kind} via API")
+        _, key = KINDS[kind]
+        out = {"imported": len(rows), "ids": rows[key].tolist(), "errors": error_list(errors)}
+        if kind == "jobs" and flag(query.get("notify")):
+            out["email_errors"] = [e for job in records(rows) for e in self.notify(job, data)]
+        return out
+
+    def notify(self, job, data):
+        # the same two emails the job form sends, held until the report is built;
+        # -> errors of emails that could not be queued
+        svc  = self.server.services
+        cust = data["customers"].drop_duplicates("ID").set_index("ID").loc[job["Customer ID"]]
+        mach = data["machines"].drop_duplicates("ID").set_index("ID").loc[job["Machine ID"]]
+        return svc.notify_job(job, cust, f"{mach['Brand']} ({mach['Model']})")
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, services, token=None):
+        super().__init__(address, Handler)
+        self.services   = services
+        self.token      = token
+        self.write_lock = threading.Lock()
+
+def main(argv=None):
+    settings = Settings.from_file()
+    ap = argparse.ArgumentParser(description="Local HTTP/JSON API for Machine Logger data.")
+    ap.add_argument("--host", default=settings.get("api", "host", API_HOST))
+    ap.add_argument("--port", type=int, default=settings.get("api", "port", API_PORT))
+    a = ap.parse_args(argv)
+
+    server = ApiServer((a.host, a.port), Services(settings),
+                       settings.get("api", "token"))
+    print(f"Listening on http://{a.host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import os
+import re
+import uuid
+import shutil
+import hashlib
+
+# -----------------------------------------------------------------------------
+# Content-addressed media store, kept out of git. CSV cells hold references
+#   blob:<sha256>/<original file name>
+# and the bytes live at <root>/<sha[:2]>/<sha><ext>. Identical uploads are
+# stored once. Derived files (thumbnails) sit under the same root.
+# -----------------------------------------------------------------------------
+CHUNK  = 1 << 20
+REF_RE = re.compile(r"^blob:([0-9a-f]{64})/(.+)$")
+
+class BlobTooLarge(ValueError):
+    pass
+
+def make_ref(digest, name):
+    return f"blob:{digest}/{os.path.basename(name)}"
+
+def parse_ref(ref):
+    # -> (digest, name) or None for legacy repo paths
+    m = REF_RE.match(ref) if isinstance(ref, str) else None
+    return (m.group(1), m.group(2)) if m else None
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class LocalBlobStore:
+    def __init__(self, root, public_url=None):
+        self.root       = root
+        self.public_url = public_url.rstrip("/") if public_url else None
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+
+    def key(self, digest, name):
+        return f"{digest[:2]}/{digest}{os.path.splitext(name)[1].lower()}"
+
+    def local_path(self, digest, name):
+        return os.path.join(self.root, *self.key(digest, name).split("/"))
+
+    def staging_path(self):
+        # same filesystem as the blobs so put(move=True) is a rename
+        return os.path.join(self.root, "tmp", uuid.uuid4().hex)
+
+    def put(self, src, name, move=False, digest=None):
+        # store a file, returning its reference; duplicates are not rewritten
+        digest = digest or file_digest(src)
+        dest = self.local_path(digest, name)
+        if os.path.exists(dest):
+            if move:
+                os.remove(src)
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if move:
+                os.replace(src, dest)
+            else:
+                tmp = self.staging_path()
+                shutil.copyfile(src, tmp)
+                os.replace(tmp, dest)
+        self.publish(dest)
+        return make_ref(digest, name)
+
+    def put_stream(self, src, name, max_bytes=None):
+        # copy a file object in CHUNK-sized pieces, hashing and sizing in the
+        # same pass; -> (reference, size). Nothing is kept if max_bytes is exceeded.
+        h, size, tmp = hashlib.sha256(), 0, self.staging_path()
+        try:
+            with open(tmp, "wb") as out:
+                for chunk in iter(lambda: src.read(CHUNK), b""):
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise BlobTooLarge(f"{name} is larger than {max_bytes // CHUNK} MB")
+                    h.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return self.put(tmp, name, move=True, digest=h.hexdigest()), size
+
+    def fetch_file(self, path):
+        # make sure a file under root is on local disk
+        return os.path.exists(path)
+
+    def path(self, ref):
+        # local path for a reference, or None if the blob is unavailable
+        digest, name = parse_ref(ref)
+        p = self.local_path(digest, name)
+        return p if self.fetch_file(p) else None
+
+    def publish(self, path):
+        # push a file written under root (blob or derivative) to the backend
+        pass
+
+    def url(self, path):
+        if not self.public_url:
+            return None
+        return f"{self.public_url}/{os.path.relpath(path, self.root).replace(os.sep, '/')}"
+
+class BucketBlobStore(LocalBlobStore):
+    # Local stand-in for object storage: the bucket is a directory reached only
+    # through put_object/get_object by key, and root acts as a read-through cache.
+    # A real S3/GCS client only has to replace those three methods.
+    def __init__(self, bucket, cache_root, public_url=None):
+        super().__init__(cache_root, public_url)
+        self.bucket = bucket
+        os.makedirs(bucket, exist_ok=True)
+
+    def _object(self, key):
+        return os.path.join(self.bucket, *key.split("/"))
+
+    def has_object(self, key):
+        return os.path.exists(self._object(key))
+
+    def put_object(self, key, path):
+        dest = self._object(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + ".part"
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, dest)
+
+    def get_object(self, key, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = self.staging_path()
+        shutil.copyfile(self._object(key), tmp)
+        os.replace(tmp, path)
+
+    def fetch_file(self, path):
+        if os.path.exists(path):
+            return True
+        key = os.path.relpath(path, self.root).replace(os.sep, "/")
+        if not self.has_object(key):
+            return False
+        self.get_object(key, path)
+        return True
+
+    def publish(self, path):
+        key = os.path.relpath(path, self.root).replace(os.sep, "/")
+        if not self.has_object(key):
+            self.put_object(key, path)
@@ -0,0 +1,285 @@
+import os
+import io
+import re
+import sys
+import time
+import uuid
+import argparse
+from datetime import datetime
+
+import pandas as pd
+
+from .datastore import CUSTOMERS_COLUMNS, MACHINES_COLUMNS, JOBS_COLUMNS, Conflict, open_tables
+from .lease import GIT_LOCK
+from .config import Settings
+
+# -----------------------------------------------------------------------------
+# Bulk import/export of customers, machines and historical jobs. Batches are
+# validated column-at-a-time with the same rules as the Streamlit forms, get
+# fresh UUIDs, and are written with one journal append per table (one fsync)
+# and one git commit. Used by the Import / Export admin view and from the
+# command line, run in the data directory:
+#   python -m machinelog.bulk import machines contract.xlsx --dry-run
+#   python -m machinelog.bulk import customers new.csv --geocode
+#   python -m machinelog.bulk export jobs --since 2024-01-01 --tech "Miki Horvath" -o q1.csv
+# -----------------------------------------------------------------------------
+PHONE_RE          = r"^\d{3}-\d{3}-\d{4}$"
+EMAIL_RE          = r"^[\w\.-]+@[\w\.-]+\.\w+$"
+ADDRESS_RE        = r".+\d+.+"
+ADDRESS_MIN_WORDS = 3
+YEAR_MIN          = 1970
+TIME_RE           = r"^\d{1,2}:\d{2}(:\d{2})?$"
+ID_RE             = r"^[0-9a-fA-F]{8}(-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}$"   # a UUID
+EXPORT_CHUNK      = 10_000
+GEOCODE_DELAY     = 1.0        # Nominatim usage policy: at most 1 request/s
+
+KINDS = {
+    "customers": (CUSTOMERS_COLUMNS, "ID"),
+    "machines":  (MACHINES_COLUMNS,  "ID"),
+    "jobs":      (JOBS_COLUMNS,      "Job ID"),
+}
+
+def valid_address(s):
+    # same rule as the Add Customer form; works on a str or a Series
+    if isinstance(s, str):
+        return bool(re.match(ADDRESS_RE, s)) and len(s.split()) >= ADDRESS_MIN_WORDS
+    return s.str.match(ADDRESS_RE) & (s.str.split().str.len() >= ADDRESS_MIN_WORDS)
+
+def read_batch(f, name):
+    # CSV or Excel file (path or file object) -> all-text DataFrame
+    ext = os.path.splitext(name)[1].lower()
+    if ext in (".xlsx", ".xls"):
+        try:
+            df = pd.read_excel(f, dtype=str)
+        except ImportError as e:
+            raise ValueError(f"Reading Excel files needs an extra package: {e}")
+    elif ext == ".csv":
+        df = pd.read_csv(f, dtype=str, keep_default_na=False)
+    else:
+        raise ValueError(f"{name}: expected a .csv, .xlsx or .xls file")
+    df.columns = [str(c).strip() for c in df.columns]
+    return df.fillna("").apply(lambda c: c.str.strip())
+
+class Report:
+    # per-row errors; Row is the spreadsheet line (header = line 1)
+    def __init__(self, df):
+        self.df    = df
+        self.parts = []
+
+    def flag(self, mask, column, error):
+        bad = self.df.index[mask.to_numpy()]
+        if len(bad):
+            self.parts.append(pd.DataFrame({"Row": bad + 2, "Column": column, "Error": error}))
+
+    def frame(self):
+        if not self.parts:
+            return pd.DataFrame(columns=["Row", "Column", "Error"])
+        return pd.concat(self.parts, ignore_index=True).sort_values("Row", kind="stable")
+
+def col(df, name):
+    return df[name] if name in df else pd.Series("", index=df.index)
+
+def required(df, rep, names):
+    for name in names:
+        rep.flag(col(df, name) == "", name, f"{name} required.")
+
+def new_ids(df, rep, key, existing):
+    # keep IDs given in the file (must be new, unique UUIDs), fill the rest
+    ids = col(df, key)
+    rep.flag((ids != "") & ~ids.str.match(ID_RE), key, f"{key} must be a UUID.")
+    rep.flag((ids != "") & (ids.isin(existing) | (ids.duplicated(keep=False) & (ids != ""))),
+             key, f"{key} already exists.")
+    fresh = pd.Series([str(uuid.uuid4()) for _ in range(len(df))], index=df.index)
+    return ids.where(ids != "", fresh)
+
+def customer_ids(df, rep, customers):
+    # "Customer ID" or "Company Name" -> existing customer ID
+    names = customers.drop_duplicates("Company Name").set_index("Company Name")["ID"]
+    given = col(df, "Customer ID")
+    cid   = given.where(given.isin(customers["ID"]), col(df, "Company Name").map(names))
+    rep.flag(cid.isna(), "Customer ID", "Unknown customer (give Customer ID or Company Name).")
+    return cid
+
+def validate(kind, df, data):
+    # -> (rows ready to append, error report); data: current table per kind
+    rep = Report(df)
+    cols, key = KINDS[kind]
+    out = pd.DataFrame({c: col(df, c) for c in cols}, index=df.index)
+    if kind == "customers":
+        required(df, rep, ["Company Name", "Contact Name"])
+        rep.flag(~valid_address(out["Address"]), "Address", "Valid address required.")
+        rep.flag(~out["Phone"].str.match(PHONE_RE), "Phone", "Phone must be 000-000-0000.")
+        rep.flag(~out["Email"].str.match(EMAIL_RE), "Email", "Valid email required.")
+        name = out["Company Name"]
+        rep.flag((name != "") & (name.isin(data["customers"]["Company Name"]) |
+                                 name.duplicated(keep=False)),
+                 "Company Name", "Company Name already exists.")
+        for c in ("Latitude", "Longitude"):
+            if c in df:
+                v = pd.to_numeric(df[c].replace("", None), errors="coerce")
+                rep.flag(v.isna() & (df[c] != ""), c, f"{c} must be a number.")
+                out[c] = v
+    elif kind == "machines":
+        out["Customer ID"] = customer_ids(df, rep, data["customers"])
+        required(df, rep, ["Brand", "Model", "Year"])
+        year = pd.to_numeric(out["Year"], errors="coerce")
+        ok   = year.between(YEAR_MIN, datetime.now().year) & (year % 1 == 0)
+        rep.flag((out["Year"] != "") & ~ok, "Year", f"Year must be {YEAR_MIN}-{datetime.now().year}.")
+        out["Year"] = year.where(ok).astype("Int64")
+    else:
+        out["Customer ID"] = cid = customer_ids(df, rep, data["customers"])
+        machines  = data["machines"]
+        serial    = machines["Serial Number"].fillna("").astype(str)
+        by_serial = machines["ID"].set_axis(serial)[(serial != "").to_numpy()]
+        by_serial = by_serial[~by_serial.index.duplicated(keep=False)]
+        mid = out["Machine ID"].where(out["Machine ID"].isin(machines["ID"]),
+                                      col(df, "Serial Number").map(by_serial))
+        rep.flag(mid.isna(), "Machine ID", "Unknown machine (give Machine ID or a unique Serial Number).")
+        owner = mid.map(machines.drop_duplicates("ID").set_index("ID")["Customer ID"])
+        rep.flag(mid.notna() & cid.notna() & (owner != cid), "Machine ID",
+                 "Machine belongs to another customer.")
+        out["Machine ID"] = mid
+        required(df, rep, ["Technician", "Employee Name", "Job Description"])
+        date = pd.to_datetime(out["Date"], errors="coerce", format="ISO8601")
+        rep.flag(date.isna(), "Date", "Date must be YYYY-MM-DD.")
+        out["Date"] = date.dt.strftime("%Y-%m-%d")
+        for c in ("Time In", "Time Out"):
+            rep.flag(~out[c].str.match(TIME_RE), c, f"{c} must be HH:MM.")
+            out[c] = out[c].where(out[c].str.count(":") != 1, out[c] + ":00").str.zfill(8)
+        travel = pd.to_numeric(out["Travel Time (min)"].replace("", "0"), errors="coerce")
+        rep.flag(~(travel >= 0), "Travel Time (min)", "Travel Time must be 0 or more minutes.")
+        out["Travel Time (min)"] = travel.where(travel >= 0).round().astype("Int64")
+    out[key] = new_ids(df, rep, key, data[kind][key])
+    errors = rep.frame()
+    return out[~out.index.isin(errors["Row"] - 2)], errors
+
+def records(rows):
+    # DataFrame -> JSON-able dicts; NaN / pandas NA -> None (JSON null)
+    rows = rows.astype(object).where(rows.notna(), None)
+    return rows.to_dict("records")
+
+def import_rows(table, rows):
+    # one journal append for the whole batch; returns the files to commit
+    return table.append_many(records(rows)) if len(rows) else []
+
+def geocode_batch(addresses, delay=GEOCODE_DELAY):
+    # address -> (lat, lon) or None, one throttled pass over unique addresses
+    from geopy.geocoders import Nominatim
+    locator, out = Nominatim(user_agent="machine_logger"), {}
+    for i, addr in enumerate(pd.unique(pd.Series(addresses))):
+        if i:
+            time.sleep(delay)
+        try:
+            loc = locator.geocode(addr, timeout=10)
+            out[addr] = (loc.latitude, loc.longitude) if loc else None
+        except Exception:
+            out[addr] = None
+    return out
+
+def filter_rows(kind, data, since=None, until=None, tech=None, customer=None):
+    # filtered subset for export; customer matches ID or company name
+    df = data[kind]
+    mask = pd.Series(True, index=df.index)
+    if customer:
+        cust = data["customers"]
+        ids = cust.loc[(cust["ID"] == customer) |
+                       cust["Company Name"].str.contains(customer, case=False, regex=False), "ID"]
+        mask &= (df["ID"] if kind == "customers" else df["Customer ID"]).isin(ids)
+    if kind == "jobs":
+        date = pd.to_datetime(df["Date"], errors="coerce", format="ISO8601")
+        if since:
+            mask &= date >= pd.Timestamp(since)
+        if until:
+            mask &= date <= pd.Timestamp(until)
+        if tech:
+            mask &= df["Technician"] == tech
+    return df[mask]
+
+def iter_csv(df, chunk=EXPORT_CHUNK):
+    # CSV text in chunks, so an export never holds the whole file in memory
+    for start in range(0, max(len(df), 1), chunk):
+        buf = io.StringIO()
+        df.iloc[start:start + chunk].to_csv(buf, index=False, header=start == 0)
+        yield buf.getvalue()
+
+def csv_bytes(df):
+    return "".join(iter_csv(df)).encode("utf-8")
+
+def git_commit(files, message, push=True):
+    from git import Repo     # GitPython, only needed when committing
+    from .gitsync import push_branch
+    with GIT_LOCK:           # a running app may be committing too
+        repo = Repo(os.getcwd())
+        repo.index.add(files)
+        repo.index.commit(message)
+        if push:
+            push_branch(repo, repo.remote(name="origin"), repo.active_branch.name)
+
+def main(argv=None):
+    ap  = argparse.ArgumentParser(description="Bulk import/export for Machine Logger data.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    im  = sub.add_parser("import", help="validate and import a CSV/Excel batch")
+    im.add_argument("kind", choices=KINDS)
+    im.add_argument("file")
+    im.add_argument("--dry-run", action="store_true", help="only print the error report")
+    im.add_argument("--skip-invalid", action="store_true", help="import the valid rows anyway")
+    im.add_argument("--geocode", action="store_true", help="look up customer coordinates")
+    im.add_argument("--no-commit", action="store_true")
+    im.add_argument("--no-push", action="store_true")
+    ex  = sub.add_parser("export", help="write a filtered table as CSV")
+    ex.add_argument("kind", choices=KINDS)
+    ex.add_argument("-o", "--out", help="output file (default: stdout)")
+    ex.add_argument("--since")
+    ex.add_argument("--until")
+    ex.add_argument("--tech")
+    ex.add_argument("--customer", help="customer ID or part of the company name")
+    a = ap.parse_args(argv)
+
+    tables = open_tables(Settings.from_file())
+    data   = {k: t.refresh() for k, t in tables.items()}
+
+    if a.cmd == "export":
+        df  = filter_rows(a.kind, data, a.since, a.until, a.tech, a.customer)
+        out = open(a.out, "w", newline="", encoding="utf-8") if a.out else sys.stdout
+        try:
+            for part in iter_csv(df):
+                out.write(part)
+        finally:
+            if a.out:
+                out.close()
+        print(f"{len(df)} row(s) exported", file=sys.stderr)
+        return 0
+
+    try:
+        batch = read_batch(a.file, a.file)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    rows, errors = validate(a.kind, batch, data)
+    if len(errors):
+        print(errors.to_string(index=False), file=sys.stderr)
+    print(f"{len(rows)} valid row(s), {errors['Row'].nunique()} with errors", file=sys.stderr)
+    if a.dry_run or not len(rows) or (len(errors) and not a.skip_invalid):
+        return 1 if len(errors) else 0
+    if a.kind == "customers" and a.geocode:
+        rows  = rows.reindex(columns=list(rows.columns) +
+                             [c for c in ("Latitude", "Longitude") if c not in rows])
+        todo  = rows["Latitude"].isna()
+        found = geocode_batch(rows.loc[todo, "Address"])
+        c = rows.loc[todo, "Address"].map(lambda addr: found.get(addr) or (None, None))
+        rows.loc[todo, "Latitude"], rows.loc[todo, "Longitude"] = c.str[0], c.str[1]
+    try:
+        files = import_rows(tables[a.kind], rows)
+    except Conflict as e:
+        print(f"Not imported, the table changed meanwhile: {e}", file=sys.stderr)
+        return 1
+    table = tables[a.kind]
+    if not files and table.compact():      # SQLite: commit the CSV export instead
+        files = [table.path, table.journal]
+    if files and not a.no_commit:
+        git_commit(files, f"Import {len(rows)} {a.kind}", push=not a.no_push)
+    print(f"Imported {len(rows)} {a.kind}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import os
+
+# -----------------------------------------------------------------------------
+# Settings: the [section] key = value knobs of .streamlit/secrets.toml. The
+# page passes st.secrets; headless tools (api.py) read the same file.
+# -----------------------------------------------------------------------------
+SECRETS_FILE = os.path.join(".streamlit", "secrets.toml")
+
+class Settings:
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def from_file(cls, path=SECRETS_FILE):
+        import tomllib
+        try:
+            with open(path, "rb") as f:
+                return cls(tomllib.load(f))
+        except FileNotFoundError:
+            return cls({})
+
+    def __getitem__(self, section):
+        return self.data[section]
+
+    def get(self, section, key, default=None):
+        # missing file/section/key -> default
+        try:
+            return self.data[section][key]
+        except Exception:
+            return default
+
+    def remote_url(self):
+        # [github] remote_url points at another remote (e.g. a local bare repo)
+        return self.get("github", "remote_url") or \
+            f"https://{self['github']['token']}@github.com/{self['github']['repo']}.git"
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import threading
+
+import pandas as pd
+
+from .lease import DATA_LOCK
+
+# -----------------------------------------------------------------------------
+# customers.csv / machines.csv / jobs.csv: schema and the journaled Table.
+# No Streamlit here, so the bulk CLI and the HTTP API write through the same path.
+# open_tables() gives the SQLite tables instead with [storage] backend = "sqlite".
+# -----------------------------------------------------------------------------
+CUSTOMERS_FILE = "customers.csv"
+MACHINES_FILE  = "machines.csv"
+JOBS_FILE      = "jobs.csv"
+
+CUSTOMERS_COLUMNS = ["ID","Company Name","Contact Name","Address","Phone","Email"]
+MACHINES_COLUMNS  = ["ID","Customer ID","Brand","Model","Year",
+                     "Serial Number","Photo Path","Observations"]
+JOBS_COLUMNS      = [
+    "Job ID","Customer ID","Machine ID","Employee Name","Technician",
+    "Date","Travel Time (min)","Time In","Time Out","Job Description",
+    "Parts Used","Additional Comments",
+    "Machine as Found Paths","Machine as Left Paths","Signature Path"
+]
+# cells naming media: a blob ref or repo path; the "...Paths" lists are ";"-separated
+MEDIA_COLUMNS = {
+    "machines": ["Photo Path"],
+    "jobs":     ["Machine as Found Paths", "Machine as Left Paths", "Signature Path"],
+}
+# single-file columns of older jobs.csv files -> the list that replaced each
+LEGACY_MEDIA_COLUMNS = {
+    "Machine as Found Path": "Machine as Found Paths",
+    "Machine as Left Path":  "Machine as Left Paths",
+}
+
+def load_df(path, cols):
+    return pd.read_csv(path) if os.path.exists(path) else pd.DataFrame(columns=cols)
+
+STORAGE_BACKENDS      = ("csv", "sqlite")   # see sqlstore.py
+
+JOURNAL_SUFFIX        = ".journal"   # e.g. jobs.csv.journal, one JSON row per line
+JOURNAL_COMPACT_EVERY = 300          # seconds between background compactions
+
+class Conflict(ValueError):
+    pass
+
+class Table:
+    # one CSV parsed once per process, re-read only when its mtime/size changes;
+    # hash indexes (value -> row positions) are built lazily per column.
+    # values holds str() of every unique column's values (built once per CSV
+    # load, then grown by each new journal line), so only new journal lines
+    # are checked for duplicates and appends are checked in O(batch).
+    # Inserts go to an fsync'd append-only journal that readers merge in right
+    # away; compact() folds it into the CSV with write-to-temp + rename.
+    # Appends and compaction hold DATA_LOCK, so other processes sharing the
+    # directory neither interleave with nor lose each other's rows.
+    # The DataFrame is shared between sessions: never mutate it in place.
+    def __init__(self, path, cols, key, unique=()):
+        self.path    = path
+        self.journal = path + JOURNAL_SUFFIX
+        self.cols    = cols
+        self.key     = key
+        self.unique  = [key, *unique]      # checked again at append time
+        self.lock    = threading.Lock()    # reader state
+        self.wlock   = threading.RLock()   # appends + compaction
+        self.stamp   = None
+        self.version = 0
+        self.main    = None
+        self.jpos    = 0                   # bytes of journal already parsed
+        self.values  = {}                  # unique column -> str values of main + journal rows
+        self.df      = None
+        self.indexes = {}
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            s = os.stat(path)
+            return (s.st_mtime_ns, s.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _read_journal(self):
+        # rows appended since the last call, minus keys the table already has
+        # (rows folded in by an interrupted compaction, lines merged twice)
+        jsize = (self._stamp(self.journal) or (0, 0))[1]
+        if jsize == self.jpos:
+            return []
+        with open(self.journal, "rb") as f:
+            f.seek(self.jpos)
+            chunk = f.read()
+        end = chunk.rfind(b"\n") + 1        # ignore a torn trailing line
+        rows = []
+        for line in chunk[:end].splitlines():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if str(row.get(self.key)) not in self.values[self.key]:
+                for col in self.unique:
+                    self.values[col].add(str(row.get(col)))
+                rows.append(row)
+        self.jpos += end
+        return rows
+
+    def refresh(self):
+        stamp = (self._stamp(self.path), self._stamp(self.journal))
+        with self.lock:
+            if self.df is None or stamp != self.stamp:
+                truncated = (stamp[1] or (0, 0))[1] < self.jpos   # by a compaction
+                if self.main is None or truncated or stamp[0] != (self.stamp or (None,))[0]:
+                    self.main = load_df(self.path, self.cols)
+                    self.values = {c: set(self.main[c].astype(str)) if c in self.main else set()
+                                   for c in self.unique}
+                    self.jpos = 0
+                    self.df = self.main
+                rows = self._read_journal()
+                if rows:
+                    self.df = pd.concat([self.df, pd.DataFrame(rows)], ignore_index=True)
+                self.stamp   = stamp
+                self.version += 1
+                self.indexes = {}
+            return self.df
+
+    def append(self, row):
+        # durable single-row insert; returns the files to commit
+        return self.append_many([row])
+
+    def _check(self, rows):
+        # compare step: the caller validated against a snapshot that may be
+        # stale; re-check unique columns against the table as it is now
+        self.refresh()
+        for col in self.unique:
+            seen, batch = self.values[col], set()
+            for r in rows:
+                v = str(r.get(col))
+                if v in seen or v in batch:
+                    raise Conflict(f"{col} already exists: {r.get(col)}")
+                batch.add(v)
+
+    def append_many(self, rows):
+        # compare-and-append: all rows in one write + fsync under the data
+        # lock, so a batch lands whole or not at all; raises Conflict if a
+        # unique value was taken since the caller read the table
+        line = "".join(json.dumps(r, default=str) + "\n" for r in rows).encode("utf-8")
+        with self.wlock, DATA_LOCK:
+            self._check(rows)
+            with open(self.journal, "a+b") as f:
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        line = b"\n" + line   # terminate a torn line left by a crash
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        return [self.journal]
+
+    def compact(self, transform=None):
+        # fold the journal into the CSV; transform(df) -> df rewrites it as well
+        with self.wlock, DATA_LOCK:
+            df = self.refresh()
+            if transform is None and not self.jpos:    # journal empty
+                return False
+            if transform is not None:
+                df = transform(df)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", newline="") as f:
+                df.to_csv(f, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            with open(self.journal, "w"):
+                pass
+            return True
+
+    def index(self, col):
+        with self.lock:
+            idx = self.indexes.get(col)
+            if idx is None:
+                idx = self.indexes[col] = self.df.groupby(col, sort=False).indices
+            return idx
+
+    def get(self, col, value):
+        # first row where col == value, or None
+        pos = self.index(col).get(value)
+        return None if pos is None else self.df.iloc[pos[0]]
+
+    def select(self, col, value):
+        # all rows where col == value
+        pos = self.index(col).get(value)
+        return self.df.iloc[0:0] if pos is None else self.df.iloc[pos]
+
+def storage_config(settings=None):
+    # [storage] backend = "csv" (default) or "sqlite"; path = the database file
+    cfg = {"backend": "csv", "path": None}
+    if settings is not None:
+        cfg = {k: settings.get("storage", k, v) for k, v in cfg.items()}
+    if cfg["backend"] not in STORAGE_BACKENDS:
+        raise ValueError(f"[storage] backend must be one of {', '.join(STORAGE_BACKENDS)}")
+    return cfg
+
+def open_tables(settings=None):
+    cfg = storage_config(settings)
+    if cfg["backend"] == "sqlite":
+        from .sqlstore import DB_FILE, open_sql_tables
+        return open_sql_tables(cfg["path"] or DB_FILE)
+    return {"customers": Table(CUSTOMERS_FILE, CUSTOMERS_COLUMNS, "ID", ["Company Name"]),
+            "machines":  Table(MACHINES_FILE,  MACHINES_COLUMNS,  "ID"),
+            "jobs":      Table(JOBS_FILE,      JOBS_COLUMNS,      "Job ID")}
+
+class DataStore:
+    def __init__(self, on_compact=None, lease=None, settings=None):
+        # with a lease, only the writer process compacts (SQLite: exports the CSVs)
+        t = open_tables(settings)
+        self.customers, self.machines, self.jobs = t["customers"], t["machines"], t["jobs"]
+        self.on_compact = on_compact
+        self.lease      = lease
+        threading.Thread(target=self._compactor, name="csv-compactor", daemon=True).start()
+
+    def tables(self):
+        return {"customers": self.customers, "machines": self.machines, "jobs": self.jobs}
+
+    def _compactor(self):
+        while True:
+            time.sleep(JOURNAL_COMPACT_EVERY)
+            if self.lease is not None and not self.lease.held():
+                continue
+            for t in (self.customers, self.machines, self.jobs):
+                try:
+                    if t.compact() and self.on_compact:
+                        self.on_compact([t.path, t.journal], f"Compact {t.path}")
+                except Exception:
+                    pass  # retried on the next round
@@ -0,0 +1,44 @@
+import os
+
+# -----------------------------------------------------------------------------
+# Web-sized and thumbnail copies of uploaded images. Runs in worker processes
+# (see media.py), so keep this module import-light; PIL loads on first use.
+#   media/.../found/IMG_1.jpeg -> media/.../found/derived/IMG_1.jpeg.web.jpg
+#                                 media/.../found/derived/IMG_1.jpeg.thumb.jpg
+# -----------------------------------------------------------------------------
+WEB_SIZE   = 1600
+THUMB_SIZE = 400
+QUALITY    = 82
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff"}
+SIZES      = (("web", WEB_SIZE), ("thumb", THUMB_SIZE))
+
+def is_image(path):
+    return isinstance(path, str) and os.path.splitext(path)[1].lower() in IMAGE_EXTS
+
+def derivative_path(path, kind):
+    folder, name = os.path.split(path)
+    return os.path.join(folder, "derived", f"{name}.{kind}.jpg")
+
+def make_derivatives(path):
+    from PIL import Image, ImageOps
+    with Image.open(path) as im:
+        im.draft("RGB", (WEB_SIZE, WEB_SIZE))   # JPEG: decode at reduced scale
+        im = ImageOps.exif_transpose(im)
+        if im.mode in ("RGBA", "LA", "P"):
+            im = im.convert("RGBA")
+            flat = Image.new("RGB", im.size, "white")
+            flat.paste(im, mask=im.getchannel("A"))
+            im = flat
+        else:
+            im = im.convert("RGB")
+
+    out = []
+    for kind, size in SIZES:
+        p = derivative_path(path, kind)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        d = im.copy()
+        d.thumbnail((size, size), Image.LANCZOS)
+        # no exif= passed: metadata (GPS, camera) is not carried over
+        d.save(p, "JPEG", quality=QUALITY, optimize=True, progressive=True)
+        out.append(p)
+    return out
@@ -0,0 +1,155 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import deque
+
+import pandas as pd
+
+from . import perf
+
+# -----------------------------------------------------------------------------
+# Geocoding: process-wide cache on disk + background batch geocoder.
+# geopy loads in the worker thread, on the first lookup.
+# -----------------------------------------------------------------------------
+GEOCODE_CACHE_FILE = "geocode_cache.json"
+GEOCODE_MIN_DELAY  = 1.0   # Nominatim usage policy: max 1 request/second
+GEOCODE_BATCH      = 20    # flush cache to disk every N lookups
+GEOCODE_RETRY_MIN  = 60    # first retry delay (s) after a failed lookup, doubled per failure
+GEOCODE_RETRY_MAX  = 3600
+
+def normalize_address(addr):
+    a = re.sub(r"\s+", " ", str(addr)).strip().lower()
+    a = re.sub(r"\s*,\s*", ", ", a)
+    return a.rstrip(" ,.")
+
+class GeocodeCache:
+    # normalized address -> (lat, lon); (None, None) = looked up, not found.
+    # Failed lookups (network, rate limit) are not cached; the worker retries
+    # them itself with a backoff: failed[key] = (retry at, failures, address),
+    # kept in memory only.
+    # version is bumped whenever coords change (keys cached map layers).
+    def __init__(self, path):
+        self.path    = path
+        self.lock    = threading.Lock()
+        self.queue   = deque()
+        self.queued  = set()
+        self.wake    = threading.Event()
+        self.coords  = {}
+        self.failed  = {}
+        self.version = 0
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.coords = {k: tuple(v) for k, v in json.load(f).items()}
+            except Exception:
+                self.coords = {}
+        self.worker = threading.Thread(target=self._run, name="geocoder", daemon=True)
+        self.worker.start()
+
+    def get(self, addr):
+        return self.coords.get(normalize_address(addr))
+
+    def put(self, addr, lat, lon):
+        key = normalize_address(addr)
+        with self.lock:
+            self.failed.pop(key, None)
+            if self.coords.get(key) != (lat, lon):
+                self.coords[key] = (lat, lon)
+                self.version += 1
+
+    def enqueue(self, addr, urgent=False):
+        key = normalize_address(addr)
+        with self.lock:
+            if key in self.coords or key in self.queued or key in self.failed:
+                return
+            self.queued.add(key)
+            (self.queue.appendleft if urgent else self.queue.append)((key, addr))
+        self.wake.set()
+
+    def pending(self):
+        return len(self.queued)
+
+    def seed(self, customers):
+        # optional Latitude/Longitude columns in customers.csv seed the cache
+        # (blank or non-numeric cells are skipped)
+        if {"Latitude", "Longitude"} <= set(customers.columns):
+            lat = pd.to_numeric(customers["Latitude"], errors="coerce")
+            lon = pd.to_numeric(customers["Longitude"], errors="coerce")
+            for addr, la, lo in zip(customers["Address"], lat, lon):
+                if pd.notna(la) and pd.notna(lo) and self.get(addr) is None:
+                    self.put(addr, float(la), float(lo))
+
+    def resolve(self, customers):
+        # customer ID -> (lat, lon); unknown addresses are queued for the worker
+        coords = {}
+        for cid, addr in customers[["ID","Address"]].itertuples(index=False):
+            c = self.get(addr)
+            if c is None:
+                self.enqueue(addr)
+                c = (None, None)
+            coords[cid] = c
+        return coords
+
+    def save(self):
+        with self.lock:
+            data = {k: list(v) for k, v in self.coords.items()}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=0, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def _next_retry(self):
+        # seconds until the earliest failed lookup is due again (None: none failed)
+        with self.lock:
+            if not self.failed:
+                return None
+            return max(0.0, min(at for at, _, _ in self.failed.values()) - time.time())
+
+    def _requeue_failed(self):
+        now = time.time()
+        with self.lock:
+            for key, (at, _, addr) in self.failed.items():
+                if at <= now and key not in self.queued:
+                    self.queued.add(key)
+                    self.queue.append((key, addr))
+
+    def _run(self):
+        locator = None
+        last = 0.0
+        while True:
+            self.wake.wait(self._next_retry())
+            self._requeue_failed()
+            if locator is None:
+                from geopy.geocoders import Nominatim
+                locator = Nominatim(user_agent="machine_logger")
+            done = 0
+            while True:
+                with self.lock:
+                    if not self.queue:
+                        self.wake.clear()
+                        break
+                    key, addr = self.queue.popleft()
+                time.sleep(max(0.0, last + GEOCODE_MIN_DELAY - time.monotonic()))
+                last = time.monotonic()
+                try:
+                    with perf.span("geocode_request"):
+                        loc = locator.geocode(addr, timeout=10)
+                    with self.lock:
+                        self.coords[key] = (loc.latitude, loc.longitude) if loc else (None, None)
+                        self.failed.pop(key, None)
+                        self.version += 1
+                except Exception:
+                    # network error: leave uncached; retried here after a backoff
+                    with self.lock:
+                        n = self.failed.get(key, (0, 0, addr))[1] + 1
+                        delay = min(GEOCODE_RETRY_MAX, GEOCODE_RETRY_MIN * 2 ** (n - 1))
+                        self.failed[key] = (time.time() + delay, n, addr)
+                with self.lock:
+                    self.queued.discard(key)
+                done += 1
+                if done % GEOCODE_BATCH == 0:
+                    self.save()
+            if done:
+                self.save()
@@ -0,0 +1,303 @@
+import io
+import os
+import re
+import json
+import time
+import threading
+
+import pandas as pd
+
+from . import perf
+from .lease import DATA_LOCK, GIT_LOCK, LEASE_POLL
+from .datastore import CUSTOMERS_FILE, MACHINES_FILE, JOBS_FILE, JOURNAL_SUFFIX
+
+# -----------------------------------------------------------------------------
+# Git sync for the data directory (the working tree of the app's repo).
+# RepoSync pulls once when the process starts, then every [github] sync_ttl
+# seconds (default SYNC_TTL; 0 = never again) on a background thread, so
+# other replicas' rows show up without a restart or a wait on a request.
+# With sparse = true (default) only top-level files (CSVs) are checked out
+# and media blobs are fetched lazily by ensure_media() when a page needs one.
+# PushQueue: saves from any process enqueue into one shared queue file; the
+# lease holder's worker commits coalesced batches and pushes with retry/backoff.
+# A push rejected because origin moved on is merged and retried; conflicts in
+# the CSVs/journals are resolved row by row (see merge_remote).
+# Survives restarts. GitPython loads on first use.
+# -----------------------------------------------------------------------------
+SPARSE_PATTERNS = ["/*", "!/media/"]
+
+PUSH_QUEUE_FILE = ".push_queue.json"
+PUSH_COALESCE   = 3     # seconds of quiet before a batch is committed
+PUSH_RETRY_MIN  = 5     # first retry delay (s), doubled per failure
+PUSH_RETRY_MAX  = 300
+TABLE_KEYS      = {CUSTOMERS_FILE: "ID", MACHINES_FILE: "ID", JOBS_FILE: "Job ID"}
+SYNC_TTL        = 60    # seconds between pulls
+URL_CREDENTIALS = re.compile(r"(\w+://)[^/@\s]+@")
+
+def redact(message):
+    # drop the credentials of any URL in an error message
+    return URL_CREDENTIALS.sub(r"\1***@", str(message))
+
+def _merged_table(path, ours, theirs):
+    # union of both sides' rows: journals by line, CSVs by key (ours first)
+    if path.endswith(JOURNAL_SUFFIX):
+        lines = ours.splitlines(keepends=True)
+        seen  = set(lines)
+        lines += [l for l in theirs.splitlines(keepends=True) if l not in seen]
+        if lines and not lines[-1].endswith("\n"):
+            lines[-1] += "\n"
+        return "".join(lines)
+    read = lambda text: pd.read_csv(io.StringIO(text), dtype=str, keep_default_na=False)
+    df = pd.concat([read(ours), read(theirs)], ignore_index=True)
+    return df.drop_duplicates(TABLE_KEYS[path], keep="first").to_csv(index=False)
+
+def merge_remote(repo, ref):
+    # merge ref into HEAD; conflicts in the tables/journals keep both sides'
+    # rows, anything else aborts the merge and raises
+    from git import GitCommandError
+    try:
+        repo.git.merge(ref, "--no-edit")
+        return
+    except GitCommandError:
+        unmerged = list(repo.index.unmerged_blobs())
+        if not unmerged:
+            raise            # refused before starting, e.g. uncommitted changes
+        tables = [p for p in unmerged if p.removesuffix(JOURNAL_SUFFIX) in TABLE_KEYS]
+        if len(tables) < len(unmerged):
+            repo.git.merge("--abort")
+            raise
+    for path in tables:
+        side = lambda n: repo.git.show(f":{n}:{path}", strip_newline_in_stdout=False)
+        with open(path, "w", newline="") as f:
+            f.write(_merged_table(path, side(2), side(3)))
+        repo.git.add(path)
+    repo.git.commit("--no-edit")
+
+def push_branch(repo, origin, branch, prepare=None):
+    # push; if rejected (or offline), bring origin's commits in and push once
+    # more. The data lock keeps appends out until the merge is committed;
+    # prepare() runs under it first (e.g. to commit what is queued).
+    from git import GitCommandError
+    try:
+        origin.push(refspec=f"{branch}:{branch}").raise_if_error()
+    except GitCommandError:
+        origin.fetch(refspec=f"{branch}:refs/remotes/origin/{branch}")
+        with DATA_LOCK:
+            if prepare:
+                prepare()
+            merge_remote(repo, f"origin/{branch}")
+        origin.push(refspec=f"{branch}:{branch}").raise_if_error()
+
+class RepoSync:
+    # prepare() runs under the data lock before each merge (e.g. to commit
+    # queued journal lines, which the merge would otherwise refuse to touch)
+    def __init__(self, settings, prepare=None):
+        self.settings = settings
+        self.prepare  = prepare
+        self.ttl      = settings.get("github", "sync_ttl", SYNC_TTL)   # 0 = once per process
+        self.sparse   = settings.get("github", "sparse", True)
+        self.lock     = GIT_LOCK   # serializes git operations across processes
+        self.repo     = None
+        self.origin   = None
+        self.last     = None
+        self.error    = None
+        self.missing  = set()
+
+    def _open(self):
+        from git import Repo  # GitPython
+        self.repo   = Repo(os.getcwd())
+        self.origin = self.repo.remote(name="origin")
+        self.origin.set_url(self.settings.remote_url())
+        if self.sparse:
+            with self.repo.config_writer() as w:
+                w.set_value('remote "origin"', "promisor", "true")
+                w.set_value('remote "origin"', "partialclonefilter", "blob:none")
+            self.repo.git.sparse_checkout("set", "--no-cone", *SPARSE_PATTERNS)
+
+    def sync(self):
+        # the first call pulls in the caller, so a new process starts from
+        # origin's rows; later pulls run on the git-pull thread, and callers
+        # only refresh their tables
+        if self.last is not None:
+            return
+        with self.lock:
+            if self.last is None:
+                self._pull()
+                if self.ttl:
+                    threading.Thread(target=self._run, name="git-pull", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(max(0.0, self.last + self.ttl - time.time()))
+            with self.lock:
+                self._pull()
+
+    def _pull(self):
+        self.last = time.time()
+        try:
+            if self.repo is None:
+                self._open()
+            branch = self.settings["github"]["branch"]
+            opts = {"filter": "blob:none"} if self.sparse else {}
+            with perf.span("git_pull"):
+                self.origin.fetch(refspec=f"{branch}:refs/remotes/origin/{branch}", **opts)
+                with DATA_LOCK:   # no journal appends while the tree is merged
+                    if self.prepare:
+                        self.prepare()
+                    merge_remote(self.repo, f"origin/{branch}")
+            self.error = None
+        except Exception as e:
+            self.error = redact(e)
+
+    def ensure_media(self, path):
+        # True if path is on disk, checking it out on demand in a sparse tree
+        if not isinstance(path, str) or not path:
+            return False
+        if os.path.exists(path):
+            return True
+        if self.repo is None or not self.sparse or path in self.missing:
+            return False
+        pattern = "/" + re.sub(r"([\[\]*?!#\\])", r"\\\1", path.replace(os.sep, "/"))
+        with self.lock:
+            try:
+                self.repo.git.sparse_checkout("add", pattern)
+            except Exception:
+                pass
+        if not os.path.exists(path):
+            self.missing.add(path)
+            return False
+        return True
+
+def push_config(settings):
+    cfg = {k: settings.get("github", k) for k in ("token","repo","branch","user_name","user_email")}
+    try:
+        cfg["url"] = settings.remote_url()
+    except Exception:
+        cfg["url"] = None
+    return cfg
+
+class PushQueue:
+    # state file: {"pending": [{"files": [...], "message": str}],
+    #              "unpushed": bool, "error": str|None, "retry_at": float|None}
+    def __init__(self, path, cfg, lease):
+        self.path   = path
+        self.cfg    = cfg
+        self.lease  = lease
+        self.repo   = None
+        self.origin = None
+        self.wake   = threading.Event()
+        self.worker = threading.Thread(target=self._run, name="git-push", daemon=True)
+        self.worker.start()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        return {"pending": [], "unpushed": False, "error": None, "retry_at": None, **state}
+
+    def _store(self, state):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def _update(self, fn):
+        # read-modify-write under the data lock; other processes share the file
+        with DATA_LOCK:
+            state = self._load()
+            fn(state)
+            self._store(state)
+
+    def enqueue(self, files, message):
+        # nothing to commit (e.g. the SQLite backend, whose rows reach git on export)
+        if not files:
+            return
+        self._update(lambda s: s["pending"].append({"files": list(files), "message": message}))
+        self.wake.set()
+
+    def status(self):
+        s = self._load()
+        return len(s["pending"]), s["unpushed"], s["error"], s["retry_at"]
+
+    def _open(self):
+        from git import Repo  # GitPython
+        c = self.cfg
+        if not c["url"]:
+            raise RuntimeError("missing [github] secrets")
+        repo   = Repo(os.getcwd())
+        origin = repo.remote(name="origin")
+        origin.set_url(c["url"])
+        with repo.config_writer() as w:
+            w.set_value("user", "name",  c["user_name"])
+            w.set_value("user", "email", c["user_email"])
+        return repo, origin
+
+    def _commit(self, repo, batch):
+        files = sorted({f for e in batch for f in e["files"] if os.path.exists(f)})
+        if files:
+            repo.index.add(files)
+        if not repo.head.is_valid() or repo.index.diff("HEAD"):
+            if len(batch) == 1:
+                message = batch[0]["message"]
+            else:
+                message = f"{len(batch)} changes\n\n" + "\n".join(f"- {e['message']}" for e in batch)
+            repo.index.commit(message)
+            return True
+        return False
+
+    def commit_pending(self):
+        # commit what is queued now; the caller holds GIT_LOCK (RepoSync
+        # runs this before merging a pull)
+        if self.repo is None:
+            self.repo, self.origin = self._open()
+        self._commit_pending(self.repo)
+
+    def _commit_pending(self, repo):
+        # commit everything queued so far
+        with DATA_LOCK:
+            batch = self._load()["pending"]
+            if not batch:
+                return
+            with perf.span("git_commit"):
+                committed = self._commit(repo, batch)
+            def done(s):
+                del s["pending"][:len(batch)]
+                s["unpushed"] = s["unpushed"] or committed
+            self._update(done)
+
+    def _run(self):
+        delay = PUSH_RETRY_MIN
+        while True:
+            # other processes enqueue too, so poll as well as wait for wake
+            self.wake.wait(LEASE_POLL)
+            self.wake.clear()
+            if not self.lease.held():
+                continue
+            n = len(self._load()["pending"])
+            if not n and not self._load()["unpushed"]:
+                continue
+            # coalesce: keep waiting while saves are still arriving
+            while True:
+                time.sleep(PUSH_COALESCE)
+                m = len(self._load()["pending"])
+                if m == n:
+                    break
+                n = m
+            try:
+                with GIT_LOCK:
+                    self.commit_pending()
+                    if self._load()["unpushed"]:
+                        with perf.span("git_push"):
+                            push_branch(self.repo, self.origin, self.cfg["branch"],
+                                        lambda: self._commit_pending(self.repo))
+                        self._update(lambda s: s.update(unpushed=False))
+                self._update(lambda s: s.update(error=None, retry_at=None))
+                delay = PUSH_RETRY_MIN
+            except Exception as e:
+                error = redact(e)
+                self._update(lambda s: s.update(error=error, retry_at=time.time() + delay))
+                time.sleep(delay)
+                delay = min(delay * 2, PUSH_RETRY_MAX)
+                self.wake.set()
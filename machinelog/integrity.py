@@ -0,0 +1,283 @@
+import os
+import re
+import sys
+import time
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from .blobstore import parse_ref, file_digest
+from .datastore import MEDIA_COLUMNS, LEGACY_MEDIA_COLUMNS, open_tables
+from .media import MEDIA_ROOT
+
+# -----------------------------------------------------------------------------
+# Integrity scan of the tables against the media, and repairs. scan_files()
+# walks a media root once on a thread pool (one task per top-level folder;
+# os.scandir returns each entry's type with the listing) into a FileIndex.
+# Every media cell, blob reference and customer/machine ID is then checked
+# against that index and the tables' ID sets, not with one stat per row.
+# repair() applies the fixes the scan found:
+#   - legacy "Machine as Found/Left Path" cells move into the ";" lists
+#   - a dangling path is relinked to the one file with the same name (ties
+#     go to files under the row's own folders, then by content hash)
+#   - a missing blob is restored from a legacy file with the same SHA-256
+# Dangling customer/machine IDs and orphaned files are only reported.
+# Run in the data directory:
+#   python -m machinelog.integrity [--hash] [--orphans] [--fix] [--workers N]
+# -----------------------------------------------------------------------------
+SCAN_WORKERS   = min(32, (os.cpu_count() or 1) * 4)   # mostly waiting on the disk
+SKIP_DIRS      = {"derived", "tmp"}      # image derivatives, the store's staging area
+BLOB_NAME_RE   = re.compile(r"^([0-9a-f]{64})(\.[^.]*)?$")
+ISSUE_COLUMNS  = ["Table", "ID", "Column", "Value", "Problem", "Fix"]
+ORPHAN_COLUMNS = ["Path", "Bytes"]
+
+def _walk(top):
+    out, stack = [], [top]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    if e.name not in SKIP_DIRS:
+                        stack.append(e.path)
+                elif e.is_file(follow_symlinks=False):
+                    out.append((e.path.replace(os.sep, "/"), e.stat(follow_symlinks=False).st_size))
+    return out
+
+def scan_files(root, workers=SCAN_WORKERS):
+    # [(path, bytes)] for every file under root
+    try:
+        top = list(os.scandir(root))
+    except OSError:
+        return []
+    files = [(e.path.replace(os.sep, "/"), e.stat().st_size) for e in top if e.is_file()]
+    dirs  = [e.path for e in top if e.is_dir() and e.name not in SKIP_DIRS]
+    with ThreadPoolExecutor(workers) as ex:
+        for part in ex.map(_walk, dirs):
+            files += part
+    return files
+
+def tracked_files(root):
+    # files git has under root, checked out or not (sparse checkouts)
+    try:
+        from git import Repo     # GitPython
+        out = Repo(os.getcwd()).git.ls_files("-z", "--", root)
+    except Exception:
+        return []
+    return [p for p in out.split("\0") if p and not SKIP_DIRS & set(p.split("/"))]
+
+def split_refs(value):
+    if not isinstance(value, str):
+        return []                # NaN: empty cell
+    return [r.strip() for r in value.split(";") if r.strip()]
+
+class FileIndex:
+    # path -> bytes (None: tracked by git, not checked out); lookups by name;
+    # content hashes filled in on demand
+    def __init__(self, files, workers=SCAN_WORKERS):
+        self.size    = dict(files)
+        self.workers = workers
+        self.by_name = None      # built by the first relink
+        self.digests = {}
+
+    def hash(self, paths):
+        todo = [p for p in paths if p not in self.digests and self.size.get(p) is not None]
+        with ThreadPoolExecutor(self.workers) as ex:
+            for p, d in zip(todo, ex.map(file_digest, todo)):
+                self.digests[p] = d
+
+    def relink(self, value, hints, by_hash=False):
+        # the one indexed file value most likely meant, or None
+        if self.by_name is None:
+            self.by_name = defaultdict(list)
+            for p in self.size:
+                self.by_name[p.rsplit("/", 1)[-1]].append(p)
+        cand = self.by_name.get(os.path.basename(value.replace("\\", "/")), [])
+        if len(cand) > 1:
+            cand = [p for p in cand if any(h in p for h in hints)] or cand
+        if len(cand) > 1 and by_hash:
+            self.hash(cand)
+            if len({self.digests.get(p) for p in cand}) == 1 and cand[0] in self.digests:
+                cand = cand[:1]
+        return cand[0] if len(cand) == 1 else None
+
+class Scan:
+    def __init__(self):
+        self.issues   = []
+        self.orphans  = []
+        self.relinks  = defaultdict(dict)   # table -> {old cell value: new}
+        self.restores = {}                  # blob ref -> legacy file with its bytes
+        self.legacy   = []                  # legacy jobs columns to fold in
+        self.files    = 0
+        self.blobs    = 0
+        self.seconds  = 0.0
+
+    def issue(self, table, key, column, value, problem, fix=""):
+        self.issues.append(dict(zip(ISSUE_COLUMNS, (table, key, column, value, problem, fix))))
+
+    def fixable(self):
+        return sum(1 for i in self.issues if i["Fix"])
+
+    def issue_frame(self):
+        return pd.DataFrame(self.issues, columns=ISSUE_COLUMNS)
+
+    def orphan_frame(self):
+        return pd.DataFrame(self.orphans, columns=ORPHAN_COLUMNS)
+
+def scan(data, store, workers=SCAN_WORKERS, by_hash=False, orphans=True, tracked=()):
+    # data: {"customers"|"machines"|"jobs": DataFrame}; store: the blob store
+    t0  = time.perf_counter()
+    res = Scan()
+    on_disk = scan_files(MEDIA_ROOT, workers)
+    files = FileIndex(on_disk + [(p, None) for p in set(tracked) - {p for p, _ in on_disk}], workers)
+    blobs = {}
+    for p, n in scan_files(getattr(store, "bucket", store.root), workers):
+        m = BLOB_NAME_RE.match(os.path.basename(p))
+        if m:
+            blobs[m.group(1)] = (p, n)
+    res.files, res.blobs = len(files.size), len(blobs)
+
+    by_digest = {}
+    if by_hash:
+        files.hash(files.size)
+        by_digest = {d: p for p, d in files.digests.items()}
+
+    referenced, used_blobs = set(), set()
+    customers, machines, jobs = data["customers"], data["machines"], data["jobs"]
+    key_col = {"machines": "ID", "jobs": "Job ID"}
+    columns = {k: [c for c in cols if c in data[k]] for k, cols in MEDIA_COLUMNS.items()}
+    columns["jobs"] += [c for c in LEGACY_MEDIA_COLUMNS if c in jobs]
+    for kind, cols in columns.items():
+        df = data[kind]
+        if not cols or not len(df):
+            continue
+        keys  = df[key_col[kind]].astype(str).tolist()
+        hints = list(zip(keys, df["Customer ID"].astype(str)))
+        for c in cols:
+            for key, hint, cell in zip(keys, hints, df[c].tolist()):
+                for ref in split_refs(cell):
+                    blob = parse_ref(ref)
+                    if blob:
+                        used_blobs.add(blob[0])
+                        if blob[0] in blobs:
+                            continue
+                        src = by_digest.get(blob[0])
+                        if src:
+                            res.restores[ref] = src
+                        res.issue(kind, key, c, ref, "missing blob", f"restore from {src}" if src else "")
+                        continue
+                    referenced.add(ref)
+                    if ref in files.size:
+                        continue
+                    new = files.relink(ref, hint, by_hash)
+                    if new:
+                        res.relinks[kind][ref] = new
+                        referenced.add(new)
+                    res.issue(kind, key, c, ref, "missing file", f"relink to {new}" if new else "")
+    res.legacy = [c for c in LEGACY_MEDIA_COLUMNS if c in jobs]
+    for old in res.legacy:
+        moved = jobs[jobs[old].map(lambda v: bool(split_refs(v)))]
+        for key, cell in zip(moved["Job ID"].astype(str), moved[old]):
+            res.issue("jobs", key, old, cell, "legacy column", f"move to {LEGACY_MEDIA_COLUMNS[old]}")
+
+    # foreign keys
+    cids, mids = set(customers["ID"].astype(str)), set(machines["ID"].astype(str))
+    for kind, df, key in (("machines", machines, "ID"), ("jobs", jobs, "Job ID")):
+        bad = df[~df["Customer ID"].astype(str).isin(cids)]
+        for k, v in zip(bad[key].astype(str), bad["Customer ID"]):
+            res.issue(kind, k, "Customer ID", v, "unknown customer")
+    bad = jobs[~jobs["Machine ID"].astype(str).isin(mids)]
+    for k, v in zip(bad["Job ID"].astype(str), bad["Machine ID"]):
+        res.issue("jobs", k, "Machine ID", v, "unknown machine")
+    m     = machines.drop_duplicates("ID")
+    owner = pd.Series(m["Customer ID"].astype(str).to_numpy(), index=m["ID"].astype(str))
+    mine  = jobs["Machine ID"].astype(str).map(owner)
+    bad   = jobs[mine.notna() & (mine != jobs["Customer ID"].astype(str))]
+    for k, v in zip(bad["Job ID"].astype(str), bad["Machine ID"]):
+        res.issue("jobs", k, "Machine ID", v, "machine belongs to another customer")
+
+    if orphans:
+        res.orphans  = [(p, n) for p, n in files.size.items() if p not in referenced]
+        res.orphans += [(p, n) for d, (p, n) in blobs.items() if d not in used_blobs]
+    res.seconds = time.perf_counter() - t0
+    return res
+
+def migrate_legacy(df):
+    # fold the legacy single-file cells into the ";" lists and drop the columns
+    for old, new in LEGACY_MEDIA_COLUMNS.items():
+        if old not in df:
+            continue
+        cur = df[new] if new in df else pd.Series("", index=df.index)
+        merged = [";".join(dict.fromkeys(split_refs(n) + split_refs(o)))
+                  for n, o in zip(cur.tolist(), df[old].tolist())]
+        df = df.assign(**{new: merged}).drop(columns=[old])
+    return df
+
+def relink_cell(value, moves):
+    refs = split_refs(value)
+    if not refs or not any(r in moves for r in refs):
+        return value
+    return ";".join(moves.get(r, r) for r in refs)
+
+def repair(tables, res, store):
+    # apply a scan's fixes; returns the table files rewritten (for git)
+    for ref, src in res.restores.items():
+        store.put(src, parse_ref(ref)[1])
+    files = []
+    for kind, cols in MEDIA_COLUMNS.items():
+        moves  = res.relinks.get(kind, {})
+        legacy = kind == "jobs" and res.legacy
+        if not moves and not legacy:
+            continue
+        def fix(df, cols=cols, moves=moves, legacy=legacy):
+            df = migrate_legacy(df) if legacy else df
+            return df.assign(**{c: df[c].map(lambda v: relink_cell(v, moves))
+                                for c in cols if c in df})
+        table = tables[kind]
+        if table.compact(fix):
+            files += [table.path, table.journal]
+    return files
+
+def main(argv=None):
+    from .config import Settings
+    from .media import make_store
+    from .bulk import git_commit
+    ap = argparse.ArgumentParser(description="Check Machine Logger tables against the media files.")
+    ap.add_argument("--hash", action="store_true",
+                    help="hash the legacy media to relink by content and restore missing blobs")
+    ap.add_argument("--orphans", action="store_true", help="list files no row references")
+    ap.add_argument("--fix", action="store_true", help="apply the fixes found")
+    ap.add_argument("--workers", type=int, default=SCAN_WORKERS)
+    ap.add_argument("--no-commit", action="store_true")
+    ap.add_argument("--no-push", action="store_true")
+    a = ap.parse_args(argv)
+
+    settings = Settings.from_file()
+    tables = open_tables(settings)
+    data   = {k: t.refresh() for k, t in tables.items()}
+    store  = make_store(settings)
+    res = scan(data, store, a.workers, a.hash, a.orphans, tracked_files(MEDIA_ROOT))
+    issues = res.issue_frame()
+    with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+        if len(issues):
+            print(issues.to_string(index=False))
+        if a.orphans and res.orphans:
+            print(res.orphan_frame().to_string(index=False))
+    n_fix = res.fixable()
+    print(f"{res.files} media file(s), {res.blobs} blob(s) scanned in {res.seconds:.2f}s: "
+          f"{len(issues)} issue(s), {n_fix} fixable, {len(res.orphans)} orphan(s)", file=sys.stderr)
+    if not a.fix or not (n_fix or res.legacy):
+        return 1 if len(issues) else 0
+    files = repair(tables, res, store)
+    if files and not a.no_commit:
+        git_commit(files, "Repair media references", push=not a.no_push)
+    print(f"Applied {n_fix} fix(es)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+
+try:
+    import fcntl
+except ImportError:      # Windows: locking is per process only
+    fcntl = None
+
+# -----------------------------------------------------------------------------
+# Coordination between the processes sharing one data directory (Streamlit
+# replicas, the API, the bulk CLI). Sessions are threads of one process.
+#   DirLock  flock on a file in the data dir, re-entrant within a process.
+#            DATA_LOCK guards journal appends, compaction and the push queue;
+#            GIT_LOCK guards every git command on the working tree.
+#   Lease    .writer_lease.json names the one process that compacts journals,
+#            commits/pushes git and sends mail. The holder renews it while it
+#            polls; another process takes over once it is LEASE_TTL s stale.
+# -----------------------------------------------------------------------------
+LOCK_FILE     = ".machinelog.lock"
+GIT_LOCK_FILE = ".machinelog.git.lock"
+LEASE_FILE    = ".writer_lease.json"
+LEASE_TTL     = 30       # seconds a lease stays valid without renewal
+LEASE_RENEW   = 10       # renew when less than this is left
+LEASE_POLL    = 2        # seconds between checks by the writer's workers
+
+class DirLock:
+    def __init__(self, path):
+        self.path  = path
+        self.rlock = threading.RLock()
+        self.depth = 0
+        self.fd    = None
+
+    def __enter__(self):
+        self.rlock.acquire()
+        try:
+            if self.depth == 0 and fcntl is not None:
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except BaseException:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+            self.rlock.release()
+            raise
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0 and self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+        self.rlock.release()
+
+DATA_LOCK = DirLock(LOCK_FILE)
+GIT_LOCK  = DirLock(GIT_LOCK_FILE)
+
+class Lease:
+    def __init__(self, path=LEASE_FILE, ttl=LEASE_TTL):
+        self.path    = path
+        self.ttl     = ttl
+        self.owner   = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.expires = 0.0
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def held(self):
+        # True if this process is the writer: renews our lease, or takes a
+        # free/stale one
+        now = time.time()
+        if self.expires - now > LEASE_RENEW:
+            return True
+        with DATA_LOCK:
+            cur = self._read()
+            if cur is None or cur["owner"] == self.owner or cur["expires"] < now:
+                tmp = self.path + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump({"owner": self.owner, "expires": now + self.ttl}, f)
+                os.replace(tmp, self.path)
+                self.expires = now + self.ttl
+                return True
+        self.expires = 0.0
+        return False
+
+    def release(self):
+        with DATA_LOCK:
+            cur = self._read()
+            if cur and cur["owner"] == self.owner:
+                os.remove(self.path)
+        self.expires = 0.0
@@ -0,0 +1,297 @@
+import os
+import re
+import json
+import time
+import uuid
+import smtplib
+import mimetypes
+import threading
+from email import encoders
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.mime.base import MIMEBase
+
+from . import perf
+from .lease import LEASE_POLL
+
+# -----------------------------------------------------------------------------
+# Email outbox (attaches the signature and the job's PDF report): enqueue() persists the message under
+# outbox/pending; one worker sends over a reused SMTP connection, retries with
+# backoff and moves permanent failures to outbox/dead. With a lease, only the
+# writer process sends, so replicas sharing outbox/ do not send twice.
+# [email] ssl = false / starttls = true select plain SMTP (e.g. aiosmtpd).
+# A job's emails are queued when it is saved and held until its report is
+# rendered (or REPORT_WAIT passes); the worker then rebuilds them with the
+# report paragraph in REPORT_SLOT and the PDF attached.
+# -----------------------------------------------------------------------------
+OUTBOX_DIR      = "outbox"
+EMAIL_RETRY_MIN = 30      # seconds, doubled per failed attempt
+EMAIL_RETRY_MAX = 3600
+EMAIL_MAX_TRIES = 8
+SMTP_IDLE_CLOSE = 120     # drop the connection after this long without mail
+REPORT_WAIT     = 600     # send held emails without the report after this long
+REPORT_POLL     = 5       # seconds between checks for a held email's report
+REPORT_SLOT     = "<!--report-->"
+
+def _attach(msg, path, name):
+    ctype, _ = mimetypes.guess_type(path)
+    maintype, subtype = (ctype or "application/octet-stream").split("/", 1)
+    part = MIMEBase(maintype, subtype)
+    with open(path, "rb") as f:
+        part.set_payload(f.read())
+    encoders.encode_base64(part)
+    part.add_header("Content-Disposition", f'attachment; filename="{name}"')
+    msg.attach(part)
+
+def build_email(sender, recipients, subject, html_body, sig_path, sig_name=None, attachments=()):
+    msg = MIMEMultipart("mixed")
+    msg["Subject"] = subject
+    msg["From"]    = sender
+    msg["To"]      = ", ".join(recipients)
+
+    alt = MIMEMultipart("alternative")
+    # Plain‑text fallback
+    text = re.sub(r"<.*?>","", html_body).replace("<br>","\n")
+    alt.attach(MIMEText(text, "plain"))
+    alt.attach(MIMEText(html_body, "html"))
+    msg.attach(alt)
+
+    # Attach signature image, then e.g. the PDF report: [(path, file name)]
+    if sig_path and os.path.exists(sig_path):
+        _attach(msg, sig_path, sig_name or os.path.basename(sig_path))
+    for path, name in attachments:
+        if path and os.path.exists(path):
+            _attach(msg, path, name)
+    return msg
+
+def report_html(url, attached):
+    # paragraph pointing at the job's service report, if there is one
+    if not url and not attached:
+        return ""
+    where = " and ".join(filter(None, [url and f'<a href="{url}">view it online</a>',
+                                       attached and "find the PDF attached"]))
+    return f"<p><strong>Service report:</strong> {where}.</p>"
+
+# job = a jobs.csv row (dict); links_html = <li> items for the "as left" media;
+# report = report_html(...)
+def customer_job_html(job, contact, customer, machine, links_html, report=""):
+    comm = job["Additional Comments"]
+    return f"""
+<p>Dear {contact},</p>
+<p>Thank you for choosing Machine Hunter for your service needs. Below are your job details:</p>
+<ul>
+  <li><strong>Job ID:</strong> {job["Job ID"]}</li>
+  <li><strong>Customer:</strong> {customer}</li>
+  <li><strong>Machine:</strong> {machine}</li>
+  <li><strong>Employee:</strong> {job["Employee Name"]}</li>
+  <li><strong>Technician:</strong> {job["Technician"]}</li>
+  <li><strong>Date:</strong> {job["Date"]}</li>
+  <li><strong>Description:</strong> {job["Job Description"]}</li>
+  {f"<li><strong>Additional Comments:</strong> {comm}</li>" if comm else ""}
+</ul>
+<p><strong>Signature:</strong> attached.</p>
+{report}
+<p><strong>Machine as it was left:</strong></p>
+<ul>
+  {links_html}
+</ul>
+<p>Please find attached your employee's signature and the multimedia of the machine as it was left by our technician.</p>
+<p>We appreciate your business and look forward to serving you again.<p>
+<p>Sincerely,<br/>Machine Hunter Service Team</p>
+"""
+
+def internal_job_html(job, customer, machine, links_html, report=""):
+    parts, comm = job["Parts Used"], job["Additional Comments"]
+    return f"""
+<p>New service job logged:</p>
+<ul>
+  <li><strong>Job ID:</strong> {job["Job ID"]}</li>
+  <li><strong>Customer:</strong> {customer}</li>
+  <li><strong>Machine:</strong> {machine}</li>
+  <li><strong>Employee:</strong> {job["Employee Name"]}</li>
+  <li><strong>Technician:</strong> {job["Technician"]}</li>
+  <li><strong>Date:</strong> {job["Date"]}</li>
+  <li><strong>Travel Time:</strong> {job["Travel Time (min)"]} minutes</li>
+  <li><strong>Time In:</strong> {job["Time In"]}</li>
+  <li><strong>Time Out:</strong> {job["Time Out"]}</li>
+  <li><strong>Description:</strong> {job["Job Description"]}</li>
+  {f"<li><strong>Parts Used:</strong> {parts}</li>" if parts else ""}
+  {f"<li><strong>Additional Comments:</strong> {comm}</li>" if comm else ""}
+</ul>
+<p><strong>Signature:</strong> attached.</p>
+{report}
+<p><strong>Machine as it was left:</strong></p>
+<ul>
+  {links_html}
+</ul>
+"""
+
+def outbox_config(settings):
+    cfg = {k: settings.get("email", k) for k in ("user", "password", "smtp_server", "smtp_port", "starttls")}
+    cfg["ssl"] = settings.get("email", "ssl", True)
+    return cfg
+
+class Outbox:
+    # reports(job ID) -> (report URL or None, PDF path) once rendered, else None
+    def __init__(self, root, cfg, lease=None, reports=None):
+        self.pending_dir = os.path.join(root, "pending")
+        self.dead_dir    = os.path.join(root, "dead")
+        for d in (self.pending_dir, self.dead_dir):
+            os.makedirs(d, exist_ok=True)
+        self.cfg       = cfg
+        self.lease     = lease
+        self.reports   = reports
+        self.conn      = None
+        self.last_used = 0.0
+        self.next_try  = {}      # pending file -> earliest send time
+        self.wake      = threading.Event()
+        self.worker = threading.Thread(target=self._run, name="smtp-outbox", daemon=True)
+        self.worker.start()
+
+    @staticmethod
+    def _write(path, item):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(item, f)
+        os.replace(tmp, path)
+
+    def enqueue(self, recipients, subject, raw, held=None):
+        # held: build_email() arguments to rebuild the message with a job's
+        # report, {"job_id", "pdf_name", "sender", "html", "sig": [path, name]}
+        name = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.json"
+        if held:
+            held = dict(held, until=time.time() + REPORT_WAIT)
+        self._write(os.path.join(self.pending_dir, name), {
+            "recipients": list(recipients), "subject": subject, "raw": raw, "held": held,
+            "attempts": 0, "next_try": 0, "error": None})
+        self.wake.set()
+
+    def _release(self, path, item):
+        # rebuild a held email once its report exists or the wait is over;
+        # False while it should keep waiting
+        h   = item["held"]
+        rep = self.reports(h["job_id"]) if self.reports else None
+        if rep is None and time.time() < h["until"]:
+            return False
+        html = h["html"].replace(REPORT_SLOT, report_html(rep and rep[0], rep is not None))
+        item["raw"] = build_email(h["sender"], item["recipients"], item["subject"], html, *h["sig"],
+                                  attachments=[(rep[1], h["pdf_name"])] if rep else []).as_string()
+        item["held"] = None
+        self._write(path, item)
+        return True
+
+    def counts(self):
+        n = lambda d: sum(1 for f in os.listdir(d) if f.endswith(".json"))
+        return n(self.pending_dir), n(self.dead_dir)
+
+    def dead_letters(self):
+        out = []
+        for name in sorted(os.listdir(self.dead_dir)):
+            if name.endswith(".json"):
+                with open(os.path.join(self.dead_dir, name)) as f:
+                    out.append(json.load(f))
+        return out
+
+    def retry_dead(self):
+        for name in os.listdir(self.dead_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.dead_dir, name)
+                with open(path) as f:
+                    item = json.load(f)
+                item.update(attempts=0, next_try=0, error=None)
+                self._write(os.path.join(self.pending_dir, name), item)
+                os.remove(path)
+        self.wake.set()
+
+    def _connect(self):
+        c = self.cfg
+        cls = smtplib.SMTP_SSL if c.get("ssl", True) else smtplib.SMTP
+        conn = cls(c["smtp_server"], c["smtp_port"], timeout=30)
+        if c.get("starttls"):
+            conn.starttls()
+        if c.get("password"):
+            conn.login(c["user"], c["password"])
+        return conn
+
+    def _close(self):
+        if self.conn is not None:
+            try:
+                self.conn.quit()
+            except Exception:
+                pass
+            self.conn = None
+
+    def _sendmail(self, item):
+        if self.conn is None:
+            self.conn = self._connect()
+        try:
+            self.conn.sendmail(self.cfg["user"], item["recipients"], item["raw"])
+        except smtplib.SMTPServerDisconnected:
+            # server dropped the idle connection: reconnect once
+            self.conn = self._connect()
+            self.conn.sendmail(self.cfg["user"], item["recipients"], item["raw"])
+        self.last_used = time.time()
+
+    def _send(self, name):
+        path = os.path.join(self.pending_dir, name)
+        with open(path) as f:
+            item = json.load(f)
+        try:
+            if item.get("held") and not self._release(path, item):
+                item["next_try"] = self.next_try[name] = min(item["held"]["until"], time.time() + REPORT_POLL)
+                return
+            with perf.span("smtp_send"):
+                self._sendmail(item)
+            os.remove(path)
+            self.next_try.pop(name, None)
+            return
+        except smtplib.SMTPAuthenticationError as e:
+            permanent, err = False, e    # config problem, not the message's fault
+        except smtplib.SMTPRecipientsRefused as e:
+            permanent, err = True, e
+        except smtplib.SMTPResponseException as e:
+            permanent, err = e.smtp_code >= 500, e
+        except Exception as e:
+            permanent, err = False, e
+        self._close()
+        item["attempts"] += 1
+        item["error"] = f"{type(err).__name__}: {err}"
+        if permanent or item["attempts"] >= EMAIL_MAX_TRIES:
+            self._write(os.path.join(self.dead_dir, name), item)
+            os.remove(path)
+            self.next_try.pop(name, None)
+        else:
+            delay = min(EMAIL_RETRY_MIN * 2 ** (item["attempts"] - 1), EMAIL_RETRY_MAX)
+            item["next_try"] = self.next_try[name] = time.time() + delay
+            self._write(path, item)
+
+    def _run(self):
+        while True:
+            self.wake.clear()
+            if self.lease is not None and not self.lease.held():
+                self._close()
+                self.wake.wait(LEASE_POLL)
+                continue
+            now, soonest = time.time(), None
+            for name in sorted(os.listdir(self.pending_dir)):
+                if not name.endswith(".json"):
+                    continue
+                if name not in self.next_try:
+                    try:
+                        with open(os.path.join(self.pending_dir, name)) as f:
+                            self.next_try[name] = json.load(f)["next_try"]
+                    except Exception:
+                        continue
+                if self.next_try[name] <= now:
+                    self._send(name)
+                if name in self.next_try:
+                    t = self.next_try[name]
+                    soonest = t if soonest is None else min(soonest, t)
+            if self.conn is not None and time.time() - self.last_used > SMTP_IDLE_CLOSE:
+                self._close()
+            timeout = SMTP_IDLE_CLOSE if soonest is None else max(0.0, soonest - time.time())
+            if self.conn is not None:
+                timeout = min(timeout, SMTP_IDLE_CLOSE)
+            if self.lease is not None:
+                timeout = min(timeout, LEASE_POLL)   # mail queued by other processes
+            self.wake.wait(timeout)
@@ -0,0 +1,84 @@
+import math
+import threading
+
+# -----------------------------------------------------------------------------
+# Customer map layer: the located customers as one GeoJSON FeatureCollection
+# plus a grid index for click lookup, rebuilt only when the coordinate set
+# (IDs, names, positions) changes. The page draws the GeoJSON inside a marker
+# cluster; a click picks the nearest customer within CLICK_PX screen pixels,
+# so the threshold follows the map's zoom level. folium stays in the page.
+# -----------------------------------------------------------------------------
+GRID_CELL = 0.02     # degrees per grid cell (~2 km)
+CLICK_PX  = 12       # click tolerance in screen pixels
+TILE_PX   = 256      # Web Mercator tile size
+
+def degrees_per_px(zoom):
+    # longitude degrees covered by one screen pixel at this zoom level
+    return 360.0 / (TILE_PX * 2 ** zoom)
+
+class GridIndex:
+    # points: [(key, lat, lon)]; buckets of point indexes by grid cell
+    def __init__(self, points, cell=GRID_CELL):
+        self.points = points
+        self.cell   = cell
+        self.cells  = {}
+        for i, (_, lat, lon) in enumerate(points):
+            self.cells.setdefault(self._cell(lat, lon), []).append(i)
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))
+
+    def nearest(self, lat, lon, zoom, px=CLICK_PX):
+        # key of the closest point within px screen pixels, else None.
+        # Distances are in longitude degrees; a latitude degree spans
+        # 1/cos(lat) times as many Mercator pixels.
+        if not self.points:
+            return None
+        k      = 1.0 / max(math.cos(math.radians(lat)), 0.01)
+        radius = px * degrees_per_px(zoom)
+        ci, cj = self._cell(lat, lon)
+        rows   = int(radius / k / self.cell) + 1
+        cols   = int(radius / self.cell) + 1
+        if (2 * rows + 1) * (2 * cols + 1) > len(self.cells):
+            # zoomed far out: scanning the occupied cells is cheaper
+            cand = (i for ids in self.cells.values() for i in ids)
+        else:
+            cand = (i for di in range(-rows, rows + 1) for dj in range(-cols, cols + 1)
+                      for i in self.cells.get((ci + di, cj + dj), ()))
+        best, bd = None, radius * radius
+        for i in cand:
+            key, plat, plon = self.points[i]
+            d = ((plat - lat) * k) ** 2 + (plon - lon) ** 2
+            if d <= bd:
+                best, bd = key, d
+        return best
+
+def layer_version(points):
+    # in-process only (str hashes are salted per process)
+    return hash(tuple(points))
+
+def to_geojson(points):
+    return {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]},
+         "properties": {"id": cid, "name": name}}
+        for cid, name, lat, lon in points]}
+
+class MarkerLayer:
+    # process-wide; get() returns (version, geojson, index) for the current
+    # points, sharing the last build while the set is unchanged. The GeoJSON
+    # dict is shared between sessions and must not be modified.
+    def __init__(self):
+        self.lock  = threading.Lock()
+        self.built = (None, None, None)
+
+    def get(self, points):
+        # points: [(customer ID, name, lat, lon)] for located customers
+        version = layer_version(points)
+        built = self.built
+        if built[0] == version:
+            return built
+        with self.lock:
+            if self.built[0] != version:
+                index = GridIndex([(cid, lat, lon) for cid, _, lat, lon in points])
+                self.built = (version, to_geojson(points), index)
+            return self.built
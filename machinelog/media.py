@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import types
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .blobstore import LocalBlobStore, BucketBlobStore, parse_ref
+from .derivatives import is_image, derivative_path, make_derivatives
+from .reports import report_paths, job_fields, build_report
+
+# -----------------------------------------------------------------------------
+# Media: content-addressed blobs outside git (see blobstore.py) plus web and
+# thumbnail copies and per-job reports built in a process pool (see
+# derivatives.py, reports.py).
+# CSV media cells hold "blob:<sha256>/<name>"; older rows hold repo paths.
+#   [media] backend = "local" | "bucket", root, bucket, public_url,
+#           max_file_mb, max_job_mb
+# -----------------------------------------------------------------------------
+MEDIA_ROOT      = "media/customers"   # legacy: media committed to git before the blob store
+MB              = 1 << 20
+VIDEO_INLINE_MB = 50     # larger videos are only previewed from a public URL
+VIDEO_EXTS      = {".mp4", ".mov", ".m4v", ".webm"}
+DERIVE_WORKERS  = min(4, os.cpu_count() or 1)
+
+def make_store(settings):
+    root = settings.get("media", "root", "media_store")
+    url  = settings.get("media", "public_url")
+    if settings.get("media", "backend", "local") == "bucket":
+        return BucketBlobStore(settings.get("media", "bucket", "media_bucket"), root, url)
+    return LocalBlobStore(root, url)
+
+def media_name(value):
+    ref = parse_ref(value)
+    return ref[1] if ref else os.path.basename(str(value))
+
+def is_video(value):
+    return os.path.splitext(media_name(value))[1].lower() in VIDEO_EXTS
+
+class Media:
+    def __init__(self, settings, repo_sync=None):
+        self.store       = make_store(settings)
+        self.repo_sync   = repo_sync      # legacy repo paths in a sparse checkout
+        self.max_file_mb = settings.get("media", "max_file_mb", 500)
+        self.max_job_mb  = settings.get("media", "max_job_mb", 1500)
+        self.lock        = threading.Lock()
+        self.pool        = None
+
+    def check_upload_sizes(self, files):
+        # size limits, checked against the reported sizes before anything is written
+        errs = [f"{f.name} is larger than {self.max_file_mb} MB."
+                for f in files if f.size > self.max_file_mb * MB]
+        if sum(f.size for f in files) > self.max_job_mb * MB:
+            errs.append(f"Uploads together are larger than {self.max_job_mb} MB.")
+        return errs
+
+    def save_stream(self, f, name):
+        # chunked copy into the store; hash and size come from the same pass.
+        # Raises BlobTooLarge past max_file_mb. -> (reference, size)
+        return self.store.put_stream(f, name, self.max_file_mb * MB)
+
+    def save_upload(self, f):
+        f.seek(0)
+        return self.save_stream(f, f.name)[0]
+
+    def ensure_media(self, path):
+        if self.repo_sync is None:
+            return isinstance(path, str) and os.path.exists(path)
+        return self.repo_sync.ensure_media(path)
+
+    def media_file(self, value):
+        # local path for a media cell, fetching it if needed; None if unavailable
+        if parse_ref(value):
+            return self.store.path(value)
+        return value if self.ensure_media(value) else None
+
+    def preview_path(self, value, kind="thumb"):
+        # smallest available local version of an image; videos/missing derivatives -> original
+        p = self.media_file(value)
+        if p and is_image(p):
+            d = derivative_path(p, kind)
+            if self.store.fetch_file(d) if parse_ref(value) else self.ensure_media(d):
+                return d
+        return p
+
+    def get_pool(self):
+        # spawn: workers import derivatives.py fresh instead of forking the server.
+        # Spawned workers re-run the parent's __main__ file, which under
+        # Streamlit is the page script, so all of them are started here, once,
+        # with __main__ hidden (in-flight no-op tasks keep each submit spawning).
+        with self.lock:
+            if self.pool is None:
+                pool = ProcessPoolExecutor(max_workers=DERIVE_WORKERS,
+                                           mp_context=multiprocessing.get_context("spawn"))
+                main = sys.modules.get("__main__")
+                sys.modules["__main__"] = types.ModuleType("__main__")
+                try:
+                    for _ in range(DERIVE_WORKERS):
+                        pool.submit(time.sleep, 0.1)
+                finally:
+                    sys.modules["__main__"] = main
+                self.pool = pool
+            return self.pool
+
+    def submit(self, fn, *args):
+        # a worker that died (e.g. killed for memory on a huge image) breaks
+        # the whole pool: replace it and submit once more
+        pool = self.get_pool()
+        try:
+            return pool.submit(fn, *args)
+        except BrokenProcessPool:
+            with self.lock:
+                if self.pool is pool:
+                    self.pool = None
+            pool.shutdown(wait=False)
+            return self.get_pool().submit(fn, *args)
+
+    def submit_derivatives(self, refs):
+        # returns {blob ref: future -> [web, thumb]}; results are published to the store.
+        # Best effort: a ref that cannot be submitted is left out (previews fall
+        # back to the original)
+        futs = {}
+        for ref in refs:
+            p = self.store.path(ref)
+            if is_image(p):
+                try:
+                    fut = self.submit(make_derivatives, p)
+                except Exception:
+                    continue
+                fut.add_done_callback(
+                    lambda f: f.exception() is None and [self.store.publish(d) for d in f.result()])
+                futs[ref] = fut
+        return futs
+
+    def report_files(self, job_id):
+        # (html, pdf) of a job's cached report, or None if it is not built yet
+        paths = report_paths(self.store.root, job_id)
+        return paths if all(self.store.fetch_file(p) for p in paths) else None
+
+    def submit_report(self, job, customer, machine):
+        # future -> [html, pdf]; built once per job ID, later calls reuse the files
+        cached = self.report_files(job["Job ID"])
+        if cached:
+            fut = Future()
+            fut.set_result(list(cached))
+            return fut
+        def section(col):
+            cell = job.get(col)
+            refs = [r for r in cell.split(";") if r] if isinstance(cell, str) else []
+            return [(media_name(r), self.media_file(r), is_video(r)) for r in refs]
+        sections = [("Machine as found", section("Machine as Found Paths")),
+                    ("Machine as left",  section("Machine as Left Paths"))]
+        sig = job.get("Signature Path")
+        fut = self.submit(build_report,
+                          *report_paths(self.store.root, job["Job ID"]),
+                          f"Service Report – {customer}", job_fields(job, customer, machine),
+                          sections, self.media_file(sig) if isinstance(sig, str) and sig else None)
+        fut.add_done_callback(
+            lambda f: f.exception() is None and [self.store.publish(p) for p in f.result()])
+        return fut
@@ -0,0 +1,100 @@
+import json
+import time
+import atexit
+import logging
+import threading
+from logging.handlers import RotatingFileHandler
+
+# -----------------------------------------------------------------------------
+# Lightweight phase timing. span(name) times a block; when a sink list is given
+# the (name, ms) pair is appended to it (per-rerun debug panel), and when a log
+# is configured the sample goes into a per-phase latency histogram that is
+# written as JSON lines every FLUSH_EVERY seconds, plus one line per slow span.
+# With neither, span() returns a shared no-op context manager.
+# -----------------------------------------------------------------------------
+BUCKETS_MS  = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+FLUSH_EVERY = 60
+SLOW_MS     = 1000
+
+_lock       = threading.Lock()
+_hist       = {}       # phase -> {"buckets": [...], "count", "sum_ms", "max_ms"}
+_log        = None
+_last_flush = time.monotonic()
+
+class _Noop:
+    __slots__ = ()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+NOOP = _Noop()
+
+class _Span:
+    __slots__ = ("name", "sink", "t0")
+    def __init__(self, name, sink):
+        self.name, self.sink = name, sink
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        record(self.name, (time.perf_counter() - self.t0) * 1000, self.sink)
+        return False
+
+def span(name, sink=None):
+    if _log is None and sink is None:
+        return NOOP
+    return _Span(name, sink)
+
+def configure(path, max_bytes=5 << 20, backups=3):
+    # idempotent; called on every rerun
+    global _log
+    if not path or _log is not None:
+        return
+    with _lock:
+        if _log is None:
+            log = logging.getLogger("machine_logger.perf")
+            log.propagate = False
+            log.setLevel(logging.INFO)
+            h = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+            h.setFormatter(logging.Formatter("%(message)s"))
+            log.addHandler(h)
+            _log = log
+            atexit.register(flush)
+
+def record(name, ms, sink=None):
+    if sink is not None:
+        sink.append((name, ms))
+    if _log is None:
+        return
+    with _lock:
+        h = _hist.get(name)
+        if h is None:
+            h = _hist[name] = {"buckets": [0] * (len(BUCKETS_MS) + 1),
+                               "count": 0, "sum_ms": 0.0, "max_ms": 0.0}
+        i = next((i for i, b in enumerate(BUCKETS_MS) if ms <= b), len(BUCKETS_MS))
+        h["buckets"][i] += 1
+        h["count"]  += 1
+        h["sum_ms"] += ms
+        h["max_ms"]  = max(h["max_ms"], ms)
+        due = time.monotonic() - _last_flush >= FLUSH_EVERY
+    if ms >= SLOW_MS:
+        _log.info(json.dumps({"ts": round(time.time(), 3), "type": "slow",
+                              "phase": name, "ms": round(ms, 1)}))
+    if due:
+        flush()
+
+def flush():
+    # write and reset the histograms collected since the last flush
+    global _last_flush
+    if _log is None:
+        return
+    with _lock:
+        hist, _last_flush = dict(_hist), time.monotonic()
+        _hist.clear()
+    now = round(time.time(), 3)
+    for phase, h in hist.items():
+        _log.info(json.dumps({"ts": now, "type": "histogram", "phase": phase,
+                              "le_ms": BUCKETS_MS + ["inf"], "buckets": h["buckets"],
+                              "count": h["count"], "sum_ms": round(h["sum_ms"], 1),
+                              "max_ms": round(h["max_ms"], 1)}))
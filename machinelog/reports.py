@@ -0,0 +1,206 @@
+import io
+import os
+import re
+import html
+import hashlib
+import base64
+import shutil
+import textwrap
+import subprocess
+
+# -----------------------------------------------------------------------------
+# Self-contained service report per job: one HTML file with the images
+# embedded as small JPEGs, and a PDF of the same content drawn with Pillow
+# (A4 pages at REPORT_DPI). Videos get a poster frame when ffmpeg is on the
+# PATH, otherwise a placeholder tile. Runs in the media worker pool (see
+# media.py), so keep this module import-light; PIL loads on first use.
+# Reports are cached by job ID next to the blobs:
+#   <media root>/reports/<job id>.html, <job id>.pdf (see report_paths)
+# -----------------------------------------------------------------------------
+REPORTS_DIR    = "reports"
+REPORT_IMG     = 800      # longest side of an embedded image (px)
+REPORT_QUALITY = 75
+REPORT_DPI     = 100
+PAGE_SIZE      = (827, 1169)   # A4 at REPORT_DPI
+MARGIN         = 50
+GRID_COLS      = 3
+POSTER_AT      = "1"      # seconds into a video for its poster frame
+
+REPORT_FIELDS  = ["Job ID", "Date", "Technician", "Employee Name", "Travel Time (min)",
+                  "Time In", "Time Out", "Job Description", "Parts Used", "Additional Comments"]
+
+def job_fields(job, customer, machine):
+    # [(label, text)] for a jobs row (dict); empty cells come out as ""
+    text = lambda v: "" if v is None or v != v else str(v)   # v != v: NaN
+    fields = [(k, text(job.get(k))) for k in REPORT_FIELDS]
+    return fields[:1] + [("Customer", customer), ("Machine", machine)] + fields[1:]
+
+def report_paths(root, job_id):
+    # job IDs other than plain [A-Za-z0-9_-] (legacy or hand-edited rows)
+    # are hashed, so an ID can never point outside the reports directory
+    name = str(job_id)
+    if not re.fullmatch(r"[\w-]+", name, re.ASCII):
+        name = "id-" + hashlib.sha256(name.encode()).hexdigest()[:32]
+    base = os.path.join(root, REPORTS_DIR, name)
+    return base + ".html", base + ".pdf"
+
+def _placeholder(label):
+    from PIL import Image, ImageDraw
+    im = Image.new("RGB", (320, 240), "#d9d9d9")
+    d  = ImageDraw.Draw(im)
+    d.polygon([(135, 85), (135, 155), (195, 120)], fill="#777")
+    d.text((160, 200), label[:40], fill="#333", anchor="mm")
+    return im
+
+def _poster(path):
+    # first frame at POSTER_AT s, via ffmpeg if available
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg or not path:
+        return None
+    from PIL import Image
+    try:
+        out = subprocess.run([ffmpeg, "-v", "error", "-ss", POSTER_AT, "-i", path, "-frames:v", "1",
+                              "-f", "image2", "-c:v", "png", "pipe:1"],
+                             capture_output=True, timeout=30, check=True).stdout
+        return Image.open(io.BytesIO(out)).convert("RGB") if out else None
+    except Exception:
+        return None
+
+def tile(path, name, video):
+    # downscaled RGB image for one media file
+    from PIL import Image, ImageOps
+    im = None
+    if video:
+        im = _poster(path)
+    elif path:
+        try:
+            with Image.open(path) as src:
+                src.draft("RGB", (REPORT_IMG, REPORT_IMG))
+                im = ImageOps.exif_transpose(src)
+                if im.mode in ("RGBA", "LA", "P"):
+                    im = im.convert("RGBA")
+                    flat = Image.new("RGB", im.size, "white")
+                    flat.paste(im, mask=im.getchannel("A"))
+                    im = flat
+                else:
+                    im = im.convert("RGB")
+        except Exception:
+            im = None
+    if im is None:
+        im = _placeholder(name if path else f"{name} (unavailable)")
+    im.thumbnail((REPORT_IMG, REPORT_IMG), Image.LANCZOS)
+    return im
+
+def _jpeg_uri(im):
+    buf = io.BytesIO()
+    im.save(buf, "JPEG", quality=REPORT_QUALITY, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+
+def _html(title, fields, sections, sig):
+    esc = lambda v: html.escape(str(v)).replace("\n", "<br>")
+    rows = "".join(f"<tr><th>{esc(k)}</th><td>{esc(v)}</td></tr>" for k, v in fields if v != "")
+    body = [f"<h1>{esc(title)}</h1>", f"<table>{rows}</table>"]
+    for heading, items in sections:
+        figs = "".join(f'<figure><img src="{_jpeg_uri(im)}" alt="{esc(name)}">'
+                       f'<figcaption>{"▶ " if video else ""}{esc(name)}</figcaption></figure>'
+                       for name, video, im in items)
+        body.append(f"<h2>{esc(heading)}</h2><div class='grid'>{figs}</div>")
+    if sig is not None:
+        body.append(f'<h2>Signature</h2><img class="sig" src="{_jpeg_uri(sig)}" alt="signature">')
+    return f"""<!doctype html>
+<html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width">
+<title>{esc(title)}</title>
+<style>
+body{{font-family:sans-serif;max-width:900px;margin:2em auto;padding:0 1em;color:#222}}
+table{{border-collapse:collapse}} th{{text-align:left;padding:4px 12px 4px 0;vertical-align:top}}
+.grid{{display:flex;flex-wrap:wrap;gap:12px}} figure{{margin:0;width:260px}}
+figure img{{width:100%;border-radius:4px}} figcaption{{font-size:12px;color:#555}}
+img.sig{{max-width:300px;border:1px solid #ddd}}
+</style></head><body>
+{"".join(body)}
+</body></html>
+"""
+
+def _font(size):
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=size)
+    except Exception:              # Pillow without FreeType: fixed bitmap font
+        return ImageFont.load_default()
+
+def _pdf_pages(title, fields, sections, sig):
+    from PIL import Image, ImageDraw
+    W, H   = PAGE_SIZE
+    f_head = _font(26)
+    f_sub  = _font(18)
+    f_text = _font(13)
+    pages  = []
+    draw, y = None, H
+
+    def need(h):
+        # start a new page unless h more pixels fit on this one
+        nonlocal draw, y
+        if y + h > H - MARGIN:
+            pages.append(Image.new("RGB", PAGE_SIZE, "white"))
+            draw, y = ImageDraw.Draw(pages[-1]), MARGIN
+
+    need(H)
+    draw.text((MARGIN, y), title, font=f_head, fill="black")
+    y += 44
+    for k, v in fields:
+        if v == "":
+            continue
+        lines = [l for part in str(v).splitlines() or [""] for l in textwrap.wrap(part, 80) or [""]]
+        need(18 * len(lines))
+        draw.text((MARGIN, y), f"{k}:", font=f_text, fill="#444")
+        for l in lines:
+            draw.text((MARGIN + 170, y), l, font=f_text, fill="black")
+            y += 18
+    cell = (W - 2 * MARGIN - (GRID_COLS - 1) * 12) // GRID_COLS
+    for heading, items in sections:
+        y += 16
+        need(30 + cell)
+        draw.text((MARGIN, y), heading, font=f_sub, fill="black")
+        y += 30
+        for i in range(0, len(items), GRID_COLS):
+            row = items[i:i + GRID_COLS]
+            ims = [im.copy() for _, _, im in row]
+            for im in ims:
+                im.thumbnail((cell, cell))
+            h = max(im.height for im in ims) + 22
+            need(h)
+            for j, ((name, video, _), im) in enumerate(zip(row, ims)):
+                x = MARGIN + j * (cell + 12)
+                pages[-1].paste(im, (x, y))
+                draw.text((x, y + im.height + 4), (("> " if video else "") + name)[:38],
+                          font=f_text, fill="#555")
+            y += h + 8
+    if sig is not None:
+        s = sig.copy()
+        s.thumbnail((300, 150))
+        y += 16
+        need(30 + s.height)
+        draw.text((MARGIN, y), "Signature", font=f_sub, fill="black")
+        pages[-1].paste(s, (MARGIN, y + 30))
+    return pages
+
+def _write(path, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+def build_report(html_path, pdf_path, title, fields, sections, sig_path):
+    # fields: [(label, value)]; sections: [(heading, [(name, local path or None, is video)])]
+    tiles = [(heading, [(name, video, tile(path, name, video)) for name, path, video in items])
+             for heading, items in sections]
+    sig = tile(sig_path, "signature", False) if sig_path else None
+    doc = _html(title, fields, tiles, sig)
+    def write_html(p):
+        with open(p, "w", encoding="utf-8") as f:
+            f.write(doc)
+    _write(html_path, write_html)
+    pages = _pdf_pages(title, fields, tiles, sig)
+    _write(pdf_path, lambda p: pages[0].save(p, "PDF", resolution=REPORT_DPI,
+                                             save_all=True, append_images=pages[1:]))
+    return [html_path, pdf_path]
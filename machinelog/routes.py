@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+from .analytics import minutes
+
+# -----------------------------------------------------------------------------
+# Daily route planning over geocoded customers. Leg times come from one
+# vectorized great-circle matrix scaled by a TravelModel: minutes = a + b * km.
+# calibrate() fits a and b to logged travel times, taking each job's
+# "Travel Time (min)" as the drive from the technician's previous job that
+# day (ordered by Time In). With too few such legs it keeps the defaults.
+# plan_route() is nearest-neighbour from the start stop, then 2-opt moves
+# scored for a whole row of candidates at once, so 50+ stops stay interactive.
+# -----------------------------------------------------------------------------
+EARTH_KM        = 6371.0
+ROAD_FACTOR     = 1.3     # road distance / straight line, for the default model
+DEFAULT_KMH     = 40
+DEFAULT_LEG_MIN = 5       # parking, walking in
+CALIBRATE_MIN   = 5       # fewer logged legs than this: keep the defaults
+TWO_OPT_PASSES  = 100
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = np.radians(lat1), np.radians(lat2)
+    dl = np.radians(lon2) - np.radians(lon1)
+    h  = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+    return 2 * EARTH_KM * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+def distance_matrix(lat, lon):
+    # n x n km between all stops
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    return haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+class TravelModel:
+    def __init__(self, a=DEFAULT_LEG_MIN, b=60 * ROAD_FACTOR / DEFAULT_KMH, legs=0):
+        self.a    = a       # minutes per leg
+        self.b    = b       # minutes per km
+        self.legs = legs    # logged legs fitted (0 = defaults)
+
+    def minutes(self, km):
+        return np.where(km > 0, self.a + self.b * km, 0.0)
+
+def logged_legs(jobs, coords, tech=None):
+    # (km, minutes) of consecutive jobs by one technician on one day
+    j = jobs if tech is None else jobs[jobs["Technician"] == tech]
+    j = pd.DataFrame({
+        "tech":   j["Technician"].astype(str),
+        "date":   j["Date"].astype(str),
+        "start":  minutes(j["Time In"]),
+        "travel": pd.to_numeric(j["Travel Time (min)"], errors="coerce"),
+        "lat":    j["Customer ID"].map(lambda c: (coords.get(c) or (None, None))[0]),
+        "lon":    j["Customer ID"].map(lambda c: (coords.get(c) or (None, None))[1]),
+    }).astype({"lat": float, "lon": float}).dropna(subset=["start"])
+    j = j.sort_values(["tech", "date", "start"], kind="stable")
+    prev = j.groupby(["tech", "date"])[["lat", "lon"]].shift()
+    km = haversine_km(prev["lat"], prev["lon"], j["lat"], j["lon"])
+    ok = km.notna() & j["travel"].notna() & (j["travel"] > 0) & (km > 0)
+    return km[ok].to_numpy(), j["travel"][ok].to_numpy()
+
+def calibrate(jobs, coords, tech=None):
+    # least-squares fit of minutes = a + b * km; the technician's own legs
+    # when there are enough of them, else everyone's
+    km, mins = logged_legs(jobs, coords, tech)
+    if tech is not None and len(km) < CALIBRATE_MIN:
+        km, mins = logged_legs(jobs, coords)
+    if len(km) < CALIBRATE_MIN:
+        return TravelModel()
+    (b, a), *_ = np.linalg.lstsq(np.column_stack([km, np.ones_like(km)]), mins, rcond=None)
+    if b <= 0:                      # no usable trend: scale the default speed
+        b, a = np.sum(mins) / np.sum(km), 0.0
+    return TravelModel(max(a, 0.0), b, len(km))
+
+def nearest_neighbour(t, start=0):
+    n = len(t)
+    seen  = np.zeros(n, dtype=bool)
+    order = [start]
+    seen[start] = True
+    for _ in range(n - 1):
+        row = np.where(seen, np.inf, t[order[-1]])
+        nxt = int(np.argmin(row))
+        order.append(nxt)
+        seen[nxt] = True
+    return order
+
+def two_opt(t, order, closed=False):
+    # reverse order[i..j] while that shortens the route; order[0] stays first.
+    # For each i every j is scored at once. t must be symmetric.
+    r = np.array(order)
+    n = len(r)
+    for _ in range(TWO_OPT_PASSES):
+        improved = False
+        for i in range(1, n - 1):
+            j  = np.arange(i + 1, n)
+            a, b, c = r[i - 1], r[i], r[j]
+            d  = r[(j + 1) % n]
+            tail = closed | (j + 1 < n)       # an open route ends at order[-1]
+            gain = (t[a, b] - t[a, c]) + np.where(tail, t[c, d] - t[b, d], 0.0)
+            k = int(np.argmax(gain))
+            if gain[k] > 1e-9:
+                r[i:j[k] + 1] = r[i:j[k] + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return r.tolist()
+
+def route_minutes(t, order, closed=False):
+    # minutes of each leg in visiting order
+    stops = list(order) + ([order[0]] if closed else [])
+    return [float(t[a, b]) for a, b in zip(stops, stops[1:])]
+
+def plan_route(lat, lon, model=None, start=0, closed=False):
+    # visiting order (indexes into lat/lon) and each leg's minutes
+    if not len(lat):
+        return [], []
+    t = (model or TravelModel()).minutes(distance_matrix(lat, lon))
+    order = two_opt(t, nearest_neighbour(t, start), closed)
+    return order, route_minutes(t, order, closed)
@@ -0,0 +1,173 @@
+import os
+import re
+import time
+import pickle
+import bisect
+import threading
+from array import array
+
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# Inverted index over the text columns of the three tables. Postings are row
+# positions, which stay valid because tables only grow at the end (same rule
+# as analytics.Rollups): update() tokenizes just the new rows. A table that
+# shrank or was rewritten is re-indexed from scratch.
+# Query terms match exactly, by prefix, and within one edit (insert, delete,
+# substitute, swap) via a map of single-character deletions of every term.
+# The index is pickled every SEARCH_SAVE_ROWS rows / SEARCH_SAVE_EVERY seconds;
+# rows newer than the snapshot are simply folded in again after a restart.
+# -----------------------------------------------------------------------------
+SEARCH_FORMAT     = 1
+SEARCH_SAVE_ROWS  = 1000
+SEARCH_SAVE_EVERY = 300
+PREFIX_MAX_TERMS  = 200
+FUZZY_MIN_LEN     = 4
+TOKEN_RE          = r"\w+"
+WEIGHTS           = {"exact": 3, "prefix": 2, "fuzzy": 1}
+
+def tokenize(text):
+    return re.findall(TOKEN_RE, text.lower())
+
+def deletes(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+class TableIndex:
+    def __init__(self, fields):
+        self.fields   = fields
+        self.n        = 0
+        self.last_key = None
+        self.postings = {}        # term -> array of row positions, ascending
+
+    def add(self, df, start):
+        # index rows df (positions start..); returns the terms seen for the first time
+        text = None
+        for f in self.fields:
+            col = df[f].fillna("").astype(str) if f in df else pd.Series("", index=df.index)
+            text = col if text is None else text + " " + col
+        tokens = text.str.lower().str.findall(TOKEN_RE)
+        tokens.index = np.arange(start, start + len(df))
+        pairs = tokens.explode().dropna()
+        pairs = pd.DataFrame({"pos": pairs.index, "term": pairs.to_numpy()}).drop_duplicates()
+        new_terms = []
+        pos = pairs["pos"].to_numpy()
+        for term, idx in pairs.groupby("term", sort=False).indices.items():
+            p = self.postings.get(term)
+            if p is None:
+                p = self.postings[term] = array("I")
+                new_terms.append(term)
+            p.frombytes(pos[idx].astype(np.uint32).tobytes())
+        return new_terms
+
+class SearchIndex:
+    def __init__(self, path, spec):
+        # spec: {table name: (key column, [text columns])}
+        self.path      = path
+        self.spec      = spec
+        self.lock      = threading.Lock()
+        self.tables    = {name: TableIndex(fields) for name, (_, fields) in spec.items()}
+        self.saved_at  = time.time()
+        self.unsaved   = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    state = pickle.load(f)
+                if state.get("format") == SEARCH_FORMAT and state.get("spec") == spec:
+                    self.tables = state["tables"]
+            except Exception:
+                pass
+        self.vocab   = []          # sorted terms of all tables, for prefix lookups
+        self.deleted = {}          # single-deletion variant -> terms
+        self._add_terms({t for ti in self.tables.values() for t in ti.postings})
+
+    def _add_terms(self, terms):
+        if len(terms) > 100:
+            self.vocab = sorted(set(self.vocab).union(terms))
+        else:
+            for t in terms:
+                i = bisect.bisect_left(self.vocab, t)
+                if i == len(self.vocab) or self.vocab[i] != t:
+                    self.vocab.insert(i, t)
+        for t in terms:
+            if len(t) >= FUZZY_MIN_LEN:
+                for d in deletes(t) | {t}:
+                    self.deleted.setdefault(d, set()).add(t)
+
+    def update(self, tables):
+        # tables: {name: DataFrame}; folds in rows appended since the last call
+        with self.lock:
+            added = 0
+            for name, df in tables.items():
+                ti, key = self.tables[name], self.spec[name][0]
+                if ti.n > len(df) or (ti.n and df[key].iat[ti.n - 1] != ti.last_key):
+                    ti = self.tables[name] = TableIndex(ti.fields)
+                if ti.n == len(df):
+                    continue
+                new = ti.add(df.iloc[ti.n:], ti.n)
+                added += len(df) - ti.n
+                ti.n, ti.last_key = len(df), df[key].iat[-1]
+                self._add_terms(set(new))
+            self.unsaved += added
+            if self.unsaved and (self.unsaved >= SEARCH_SAVE_ROWS or
+                                 time.time() - self.saved_at >= SEARCH_SAVE_EVERY):
+                self._save()
+            return added
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"format": SEARCH_FORMAT, "spec": self.spec, "tables": self.tables}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self.unsaved, self.saved_at = 0, time.time()
+
+    def expand(self, token):
+        # -> {term: weight} for one query token
+        out = {}
+        i = bisect.bisect_left(self.vocab, token)
+        for t in self.vocab[i:i + PREFIX_MAX_TERMS]:
+            if not t.startswith(token):
+                break
+            out[t] = WEIGHTS["exact"] if t == token else WEIGHTS["prefix"]
+        if len(token) >= FUZZY_MIN_LEN:
+            for d in deletes(token) | {token}:
+                for t in self.deleted.get(d, ()):
+                    out.setdefault(t, WEIGHTS["fuzzy"])
+        return out
+
+    def search(self, query, table, limit=20):
+        # row positions in table matching every query token, best first
+        # (score, then newest)
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            postings = self.tables[table].postings
+            acc_d = acc_w = None
+            for token in tokens:
+                ds, ws = [], []
+                for term, w in self.expand(token).items():
+                    p = postings.get(term)
+                    if p:
+                        ds.append(np.frombuffer(p, dtype=np.uint32))
+                        ws.append(np.full(len(p), w, dtype=np.int32))
+                if not ds:
+                    return []
+                d, w = np.concatenate(ds), np.concatenate(ws)
+                ds = ws = None                       # views pin the arrays against extend()
+                order = np.lexsort((-w, d))          # per row keep the best-matching term
+                d, w  = d[order], w[order]
+                first = np.r_[True, d[1:] != d[:-1]]
+                d, w  = d[first], w[first]
+                if acc_d is None:
+                    acc_d, acc_w = d, w
+                else:
+                    acc_d, ia, ib = np.intersect1d(acc_d, d, assume_unique=True, return_indices=True)
+                    acc_w = acc_w[ia] + w[ib]
+                if not len(acc_d):
+                    return []
+        top = np.lexsort((-acc_d.astype(np.int64), -acc_w))[:limit]
+        return acc_d[top].tolist()
@@ -0,0 +1,147 @@
+import atexit
+import threading
+
+from . import perf
+from .gitsync import PUSH_QUEUE_FILE, RepoSync, PushQueue, push_config
+from .mail import (OUTBOX_DIR, REPORT_SLOT, Outbox, outbox_config, build_email,
+                   customer_job_html, internal_job_html)
+from .geocode import GEOCODE_CACHE_FILE, GeocodeCache
+from .maplayer import MarkerLayer
+from .media import Media, media_name
+from .datastore import DataStore
+from .lease import Lease
+
+# -----------------------------------------------------------------------------
+# Services: the process-wide components (tables, git, outbox, media, caches),
+# each built on first use so a caller only starts the workers it touches.
+# The Streamlit page keeps one per process (st.cache_resource); api.py and
+# other replicas make their own. All of them share the data directory: the
+# process holding the writer lease compacts, commits/pushes and sends mail.
+# -----------------------------------------------------------------------------
+ROLLUPS_FILE = "analytics_rollups.pkl"
+SEARCH_FILE  = "search_index.pkl"
+SEARCH_SPEC  = {
+    "customers": ("ID",     ["Company Name","Contact Name","Address"]),
+    "machines":  ("ID",     ["Brand","Model","Serial Number","Observations"]),
+    "jobs":      ("Job ID", ["Job Description","Parts Used","Additional Comments"]),
+}
+
+class Services:
+    def __init__(self, settings):
+        self.settings = settings
+        self.lease    = Lease()
+        atexit.register(self.lease.release)   # hand over without waiting out the TTL
+        self.lock     = threading.RLock()
+        self.made     = {}
+
+    def _get(self, key, make):
+        with self.lock:
+            if key not in self.made:
+                self.made[key] = make()
+            return self.made[key]
+
+    @property
+    def repo_sync(self):
+        return self._get("repo_sync", lambda: RepoSync(self.settings, self.push.commit_pending))
+
+    @property
+    def push(self):
+        return self._get("push", lambda: PushQueue(
+            PUSH_QUEUE_FILE, push_config(self.settings), self.lease))
+
+    @property
+    def db(self):
+        return self._get("db", self._make_db)
+
+    def _make_db(self):
+        # a process with the tables may become the writer, so it runs the
+        # writer's workers too (idle while another process holds the lease)
+        self.push, self.outbox
+        return DataStore(on_compact=lambda files, msg: self.push.enqueue(files, msg),
+                         lease=self.lease, settings=self.settings)
+
+    @property
+    def outbox(self):
+        return self._get("outbox", lambda: Outbox(
+            OUTBOX_DIR, outbox_config(self.settings), self.lease, self._report))
+
+    def _report(self, job_id):
+        # (URL, PDF path) of a job's rendered report for held emails, else None
+        paths = self.media.report_files(job_id)
+        return paths and (self.media.store.url(paths[0]), paths[1])
+
+    @property
+    def media(self):
+        return self._get("media", lambda: Media(self.settings, self.repo_sync))
+
+    @property
+    def geo(self):
+        return self._get("geo", lambda: GeocodeCache(GEOCODE_CACHE_FILE))
+
+    @property
+    def map_layer(self):
+        return self._get("map_layer", MarkerLayer)
+
+    @property
+    def rollups(self):
+        from .analytics import Rollups
+        return self._get("rollups", lambda: Rollups(ROLLUPS_FILE))
+
+    @property
+    def search(self):
+        from .search import SearchIndex
+        return self._get("search", lambda: SearchIndex(SEARCH_FILE, SEARCH_SPEC))
+
+    def push_to_github(self, files, message, sink=None):
+        with perf.span("push_to_github", sink):
+            self.push.enqueue(files, message)
+
+    def send_email(self, recipients, subject, html_body, sig_path, sig_name=None, sink=None,
+                   attachments=(), report=None):
+        # report=(job ID, PDF name): hold the email until that job's report is
+        # rendered; html_body then marks the report paragraph with REPORT_SLOT
+        with perf.span("send_email", sink):
+            sender = self.settings.get("email", "user")
+            msg = build_email(sender, recipients, subject, html_body.replace(REPORT_SLOT, ""),
+                              sig_path, sig_name, attachments)
+            held = report and {"job_id": report[0], "pdf_name": report[1], "sender": sender,
+                               "html": html_body, "sig": [sig_path, sig_name]}
+            self.outbox.enqueue(recipients, subject, msg.as_string(), held)
+
+    def notify_job(self, job, customer, machine):
+        # confirmation + internal emails for a logged job. Both are persisted
+        # in the outbox right away and held there until the report (submitted
+        # here) is rendered, then sent with it attached. Each email is queued
+        # on its own; returns the errors of those that could not be.
+        media = self.media
+        jid   = job["Job ID"]
+        try:
+            media.submit_report(job, customer["Company Name"], machine)
+        except Exception:
+            pass    # the held emails go out without it after REPORT_WAIT
+        def link(ref):
+            p   = media.preview_path(ref, "web")
+            url = p and media.store.url(p)
+            return f'<a href="{url}">{media_name(ref)}</a>' if url else media_name(ref)
+        lefts = job.get("Machine as Left Paths")
+        links = "".join(f"<li>{link(r)}</li>"
+                        for r in (lefts.split(";") if isinstance(lefts, str) else []) if r)
+        sig      = job.get("Signature Path")
+        sig_path = media.media_file(sig) if isinstance(sig, str) and sig else None
+        emails = [
+            ([customer["Email"]], f"Service Job Confirmation – {jid}",
+             lambda: customer_job_html(job, customer["Contact Name"], customer["Company Name"],
+                                       machine, links, REPORT_SLOT)),
+            ([self.settings.get("email", "user")], f"Service Job Logged – {jid}",
+             lambda: internal_job_html(job, customer["Company Name"], machine, links, REPORT_SLOT)),
+        ]
+        errors = []
+        for to, subject, body in emails:
+            try:
+                if not all(isinstance(r, str) and r for r in to):
+                    raise ValueError("no recipient address (customer Email / [email] user)")
+                self.send_email(to, subject, body(), sig_path, f"{jid}_sig.png",
+                                report=(jid, f"{jid}_report.pdf"))
+            except Exception as e:
+                errors.append(f"{subject}: {e}")
+        return errors
@@ -0,0 +1,373 @@
+import os
+import re
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from .lease import DATA_LOCK
+from .datastore import (CUSTOMERS_FILE, MACHINES_FILE, JOBS_FILE,
+                        CUSTOMERS_COLUMNS, MACHINES_COLUMNS, JOBS_COLUMNS, JOURNAL_SUFFIX,
+                        Conflict, Table)
+
+# -----------------------------------------------------------------------------
+# Optional SQLite backend ([storage] backend = "sqlite"): one WAL-mode file
+# with typed columns, the job media lists in a job_media child table and
+# indexes on customer/machine/date. SqlTable has the calls of datastore.Table
+# (refresh/append/append_many/compact/get/select), so callers do not change.
+#   - refresh() keeps the DataFrame and reads only rows added since the last
+#     call; a rewrite (compact with a transform) bumps a generation in meta
+#     and forces a full read. get()/select() query the indexes directly.
+#   - Schema changes are numbered MIGRATIONS tracked in PRAGMA user_version.
+#     The first run creates the tables and imports customers.csv etc.,
+#     journals included, folding legacy single-file media columns in.
+#   - The CSVs stay the git backup: compact() exports a table to its CSV when
+#     it changed, and the writer's compactor commits them as before. CSVs
+#     changed by a git pull are read back in; only rows with new keys are
+#     added, so the database wins for rows it already has.
+#   python -m machinelog.sqlstore [--db FILE] {migrate,export}
+# -----------------------------------------------------------------------------
+DB_FILE      = "machinelog.db"
+BUSY_TIMEOUT = 30         # seconds to wait for another writer
+QUERY_CHUNK  = 500        # bound parameters per IN (...) query
+IMPORT_CACHE_KB = 65536   # page cache while importing a CSV (default is 2 MB)
+
+COORD_COLUMNS = ["Latitude", "Longitude"]
+TABLES = {   # name -> (CSV file, columns, key, other unique columns)
+    "customers": (CUSTOMERS_FILE, CUSTOMERS_COLUMNS + COORD_COLUMNS, "ID", ["Company Name"]),
+    "machines":  (MACHINES_FILE,  MACHINES_COLUMNS,  "ID",     []),
+    "jobs":      (JOBS_FILE,      JOBS_COLUMNS,      "Job ID", []),
+}
+# ";"-joined list columns of jobs -> job_media.kind
+JOB_MEDIA = {"Machine as Found Paths": "found", "Machine as Left Paths": "left"}
+
+def sql_name(col):
+    # "Travel Time (min)" -> travel_time_min
+    return re.sub(r"\W+", "_", col.lower()).strip("_")
+
+def _fields(name):
+    # columns stored in the table itself
+    return [c for c in TABLES[name][1] if name != "jobs" or c not in JOB_MEDIA]
+
+def _cell(v):
+    if v is None or v is pd.NA or (not isinstance(v, str) and pd.isna(v)) or v == "":
+        return None
+    if hasattr(v, "item"):              # numpy scalar
+        v = v.item()
+    return v if isinstance(v, (int, float, str)) else str(v)
+
+def _refs(v):
+    return [r for r in v.split(";") if r] if isinstance(v, str) else []
+
+def insert_frame(con, name, df, ignore=False):
+    # df: rows by column name (missing columns are NULL, extra ones dropped).
+    # ignore=True skips rows whose key is already stored (a git pull, the
+    # first import). Only keys are unique in the schema: older CSVs can
+    # repeat a company name, and appends check the other columns (_check).
+    fields = _fields(name)
+    key    = TABLES[name][2]
+    if ignore:
+        have = {k for (k,) in con.execute(f"SELECT {sql_name(key)} FROM {name}")}
+        df = df[~df[key].astype(str).isin(have)].drop_duplicates(key)
+    vals = df.reindex(columns=fields).astype(object)
+    vals = vals.where(vals.notna() & (vals != ""), None)
+    con.executemany(f"INSERT INTO {name} "
+                    f"({', '.join(sql_name(c) for c in fields)}) VALUES ({', '.join('?' * len(fields))})",
+                    vals.itertuples(index=False, name=None))
+    if name == "jobs":
+        con.executemany("INSERT INTO job_media "
+                        "(job_id, kind, pos, ref) VALUES (?, ?, ?, ?)",
+                        sorted((jid, kind, i, ref) for col, kind in JOB_MEDIA.items() if col in df
+                               for jid, cell in zip(df[key].tolist(), df[col].tolist())
+                               for i, ref in enumerate(_refs(cell))))   # in clustered order
+    return len(df)
+
+def _csv_stamp(path):
+    return json.dumps([Table._stamp(path), Table._stamp(path + JOURNAL_SUFFIX)])
+
+def _set_meta(con, key, value):
+    con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+def import_csv(con, name):
+    # add the rows of a table's CSV + journal that the database lacks
+    from .integrity import migrate_legacy
+    path, cols, key, _ = TABLES[name]
+    stamp = _csv_stamp(path)
+    df = Table(path, cols, key).refresh()
+    if name == "jobs":
+        df = migrate_legacy(df)
+    size = con.execute("PRAGMA cache_size").fetchone()[0]
+    con.execute(f"PRAGMA cache_size = -{IMPORT_CACHE_KB}")
+    try:
+        n = insert_frame(con, name, df, ignore=True)
+    finally:
+        con.execute(f"PRAGMA cache_size = {size}")
+    _set_meta(con, f"csv:{name}", stamp)
+    return n
+
+# -----------------------------------------------------------------------------
+# Migrations: MIGRATIONS[i] takes user_version i to i + 1 inside one
+# transaction. Append new steps; never edit a released one.
+# -----------------------------------------------------------------------------
+SCHEMA_V1 = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE customers (
+    id TEXT PRIMARY KEY, company_name TEXT NOT NULL, contact_name TEXT,
+    address TEXT, phone TEXT, email TEXT, latitude REAL, longitude REAL);
+CREATE TABLE machines (
+    id TEXT PRIMARY KEY, customer_id TEXT, brand TEXT, model TEXT, year INTEGER,
+    serial_number TEXT, photo_path TEXT, observations TEXT);
+CREATE TABLE jobs (
+    job_id TEXT PRIMARY KEY, customer_id TEXT, machine_id TEXT, employee_name TEXT,
+    technician TEXT, date TEXT, travel_time_min INTEGER, time_in TEXT, time_out TEXT,
+    job_description TEXT, parts_used TEXT, additional_comments TEXT, signature_path TEXT);
+CREATE TABLE job_media (
+    job_id TEXT NOT NULL REFERENCES jobs (job_id) ON DELETE CASCADE,
+    kind TEXT NOT NULL, pos INTEGER NOT NULL, ref TEXT NOT NULL,
+    PRIMARY KEY (job_id, kind, pos)) WITHOUT ROWID;
+CREATE INDEX customers_name ON customers (company_name);
+CREATE INDEX machines_customer ON machines (customer_id);
+CREATE INDEX jobs_customer ON jobs (customer_id, date);
+CREATE INDEX jobs_machine ON jobs (machine_id, date);
+CREATE INDEX jobs_date ON jobs (date);
+CREATE INDEX jobs_technician ON jobs (technician, date);
+"""
+
+def _create_v1(con):
+    for stmt in SCHEMA_V1.split(";"):
+        if stmt.strip():
+            con.execute(stmt)
+
+def _import_csv_layout(con):
+    for name in TABLES:
+        import_csv(con, name)
+
+MIGRATIONS = [_create_v1, _import_csv_layout]
+
+MEDIA_LISTS_SQL = f"""SELECT job_id, {", ".join(
+    f"group_concat(CASE WHEN kind = '{kind}' THEN ref END, ';')" for kind in JOB_MEDIA.values())}
+    FROM job_media GROUP BY job_id"""
+
+class Database:
+    # one SQLite file; a connection per thread (WAL: readers never block the
+    # writer), writes in BEGIN IMMEDIATE transactions
+    def __init__(self, path=DB_FILE):
+        self.path  = path
+        self.local = threading.local()
+        self.wlock = threading.RLock()
+        self.migrate()
+
+    def con(self):
+        con = getattr(self.local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                  check_same_thread=False)
+            con.execute("PRAGMA journal_mode = WAL")
+            con.execute("PRAGMA synchronous = FULL")   # durable per commit, like the journal fsync
+            con.execute("PRAGMA foreign_keys = ON")
+            self.local.con = con
+        return con
+
+    @contextmanager
+    def write(self):
+        with self.wlock:
+            con = self.con()
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            con.execute("COMMIT")
+
+    def version(self):
+        return self.con().execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self):
+        if self.version() == len(MIGRATIONS):
+            return
+        # the data lock keeps journal appends and git merges out of the import
+        with DATA_LOCK, self.write() as con:
+            v = con.execute("PRAGMA user_version").fetchone()[0]
+            if v > len(MIGRATIONS):
+                raise RuntimeError(f"{self.path} has schema v{v}; this code knows v{len(MIGRATIONS)}")
+            for i in range(v, len(MIGRATIONS)):
+                MIGRATIONS[i](con)
+                con.execute(f"PRAGMA user_version = {i + 1}")
+
+    def meta(self, key):
+        row = self.con().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row and row[0]
+
+class SqlTable:
+    # datastore.Table over one SQLite table. path/journal are the CSV export
+    # and the legacy journal (emptied by each export), i.e. the files to commit.
+    # The DataFrame is shared between sessions: never mutate it in place.
+    def __init__(self, db, name):
+        self.db      = db
+        self.name    = name
+        self.path, self.cols, self.key, unique = TABLES[name]
+        self.journal = self.path + JOURNAL_SUFFIX
+        self.unique  = [self.key, *unique]
+        self.fields  = _fields(name)
+        self.lock    = threading.Lock()    # reader state
+        self.version = 0
+        self.df      = None
+        self.seen    = None                # (generation, last rowid) in df
+        self.pulled  = None                # CSV stamp last checked
+        # per-row subqueries for the media lists: cheap for a few rows
+        # (get/select/new rows); a full read aggregates job_media once instead
+        media = lambda col: ("(SELECT group_concat(ref, ';') FROM (SELECT ref FROM job_media m "
+                             f"WHERE m.job_id = t.job_id AND m.kind = '{JOB_MEDIA[col]}' ORDER BY m.pos))")
+        cols = lambda lists: ", ".join(lists(c) if c not in self.fields else sql_name(c)
+                                       for c in self.cols)
+        self.select_sql = f"SELECT {cols(media)} FROM {name} t"
+        self.plain_sql  = f"SELECT {cols(lambda c: 'NULL')} FROM {name} t"
+
+    def _query(self, where="", params=(), sql=None):
+        rows = self.db.con().execute(f"{sql or self.select_sql} {where}", params).fetchall()
+        return pd.DataFrame(rows, columns=self.cols).fillna(np.nan)   # all-NULL columns: None -> NaN
+
+    def _read_all(self):
+        if self.name != "jobs":
+            return self._query("ORDER BY t.rowid")
+        df = self._query("ORDER BY t.rowid", sql=self.plain_sql)
+        # job_media is clustered by (job_id, kind, pos), so each list comes out in order
+        lists = pd.DataFrame(self.db.con().execute(MEDIA_LISTS_SQL).fetchall(),
+                             columns=[self.key, *JOB_MEDIA]).set_index(self.key)
+        return df.assign(**{col: df[self.key].map(lists[col]) for col in JOB_MEDIA})
+
+    def _pull(self):
+        # read back rows a git pull added to the CSV or its journal
+        stamp = _csv_stamp(self.path)
+        if stamp == self.pulled:
+            return
+        with DATA_LOCK:
+            stamp = _csv_stamp(self.path)
+            if stamp != self.db.meta(f"csv:{self.name}"):
+                with self.db.write() as con:
+                    import_csv(con, self.name)
+            self.pulled = stamp
+
+    def _mark(self):
+        gen, last = self.db.con().execute(
+            f"SELECT (SELECT value FROM meta WHERE key = ?), (SELECT max(rowid) FROM {self.name})",
+            (f"gen:{self.name}",)).fetchone()
+        return gen or "0", last or 0
+
+    def refresh(self):
+        self._pull()
+        with self.lock:
+            mark = self._mark()
+            if self.df is None or mark != self.seen:
+                if self.df is None or mark[0] != self.seen[0]:
+                    self.df = self._read_all()
+                else:
+                    new = self._query("WHERE t.rowid > ? ORDER BY t.rowid", (self.seen[1],))
+                    self.df = pd.concat([self.df, new], ignore_index=True)
+                self.seen    = mark
+                self.version += 1
+            return self.df
+
+    def append(self, row):
+        return self.append_many([row])
+
+    def _check(self, con, rows):
+        # unique values already taken (compared as text, like Table) or repeated
+        for col in self.unique:
+            new = pd.Series([r.get(col) for r in rows], dtype=object).astype(str)
+            taken = set()
+            vals = new.unique().tolist()
+            for i in range(0, len(vals), QUERY_CHUNK):
+                part = vals[i:i + QUERY_CHUNK]
+                taken.update(str(v) for (v,) in con.execute(
+                    f"SELECT {sql_name(col)} FROM {self.name} "
+                    f"WHERE {sql_name(col)} IN ({', '.join('?' * len(part))})", part))
+            dup = new[new.isin(taken) | new.duplicated()]
+            if len(dup):
+                raise Conflict(f"{col} already exists: {dup.iloc[0]}")
+
+    def append_many(self, rows):
+        # one transaction: the batch lands whole or not at all; raises
+        # Conflict if a unique value was taken since the caller read the table.
+        # Nothing to commit yet: the next export carries the rows to git.
+        with self.db.write() as con:
+            self._check(con, rows)
+            insert_frame(con, self.name, pd.DataFrame([{c: _cell(r.get(c)) for c in self.cols}
+                                                        for r in rows], columns=self.cols))
+        return []
+
+    def compact(self, transform=None):
+        # transform(df) -> df rewrites the table; then export it to the CSV
+        # (and empty the journal) if it changed since the last export
+        with DATA_LOCK:
+            if transform is not None:
+                df = transform(self.refresh())
+                with self.db.write() as con:
+                    con.execute(f"DELETE FROM {self.name}")   # job_media rows cascade
+                    insert_frame(con, self.name, df)
+                    gen = int(self.db.meta(f"gen:{self.name}") or 0) + 1
+                    _set_meta(con, f"gen:{self.name}", str(gen))
+            mark = json.dumps(self._mark())
+            if (mark == self.db.meta(f"export:{self.name}")
+                    and _csv_stamp(self.path) == self.db.meta(f"csv:{self.name}")):
+                return False
+            df  = self.refresh()
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", newline="") as f:
+                df.to_csv(f, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            with open(self.journal, "w"):
+                pass
+            with self.db.write() as con:
+                _set_meta(con, f"export:{self.name}", mark)
+                _set_meta(con, f"csv:{self.name}", _csv_stamp(self.path))
+            self.pulled = None
+            return True
+
+    def get(self, col, value):
+        # first row where col == value, or None (indexed columns stay fast)
+        row = self.db.con().execute(f"{self.select_sql} WHERE t.{sql_name(col)} = ? "
+                                    "ORDER BY t.rowid LIMIT 1", (_cell(value),)).fetchone()
+        return None if row is None else pd.Series([np.nan if v is None else v for v in row],
+                                                  index=self.cols, dtype=object)
+
+    def select(self, col, value):
+        # all rows where col == value
+        return self._query(f"WHERE t.{sql_name(col)} = ? ORDER BY t.rowid", (_cell(value),))
+
+def open_sql_tables(path=DB_FILE):
+    db = Database(path)
+    return {name: SqlTable(db, name) for name in TABLES}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Machine Logger SQLite storage.")
+    ap.add_argument("--db", default=DB_FILE)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("migrate", help="create/upgrade the database, importing the CSVs")
+    ex = sub.add_parser("export", help="write every table to its CSV and commit them")
+    ex.add_argument("--no-commit", action="store_true")
+    ex.add_argument("--no-push", action="store_true")
+    a = ap.parse_args(argv)
+
+    tables = open_sql_tables(a.db)
+    if a.cmd == "migrate":
+        rows = ", ".join(f"{len(t.refresh())} {k}" for k, t in tables.items())
+        print(f"{a.db}: schema v{tables['jobs'].db.version()}, {rows}", file=sys.stderr)
+        return 0
+    files = [f for t in tables.values() if t.compact() for f in (t.path, t.journal)]
+    if files and not a.no_commit:
+        from .bulk import git_commit
+        git_commit(files, "Export tables from SQLite", push=not a.no_push)
+    print(f"Exported {len(files) // 2} table(s)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())